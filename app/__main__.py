@@ -0,0 +1,30 @@
+"""
+Bot entry point, `python -m app`.
+Heavy imports are timed one by one, the breakdown is logged with the startup line.
+"""
+import importlib
+import time
+
+STARTUP_MODULES = ["logbook", "aiohttp", "aiotg", "app.bot"]
+
+
+def import_startup_modules() -> dict:
+    result = {}
+
+    for module_name in STARTUP_MODULES:
+        started_at = time.monotonic()
+        importlib.import_module(module_name)
+        result[module_name] = round(time.monotonic() - started_at, 6)
+
+    return result
+
+
+def main():
+    import_durations = import_startup_modules()
+
+    from app import bot
+    bot.main(import_durations)
+
+
+if __name__ == "__main__":
+    main()
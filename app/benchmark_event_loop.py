@@ -0,0 +1,208 @@
+"""
+Compare default asyncio and uvloop event loops through the local fake Bot API.
+
+Every event loop runs in a fresh process which starts the bot with its regular `main`,
+so settings, event loop policy, warm start and shutdown are the same as in production.
+The bot polls synthetic updates from `FakeBotApi` served by this process
+and handles them with the real handlers against a scratch database.
+
+Cold start is the time from the worker process launch to the first handled update,
+with `--cold-start-budget` the benchmark fails when any event loop exceeds it.
+
+Usage:
+    python -m app.benchmark_event_loop --chats 20 --clicks 250
+    python -m app.benchmark_event_loop --chats 1 --clicks 1 --cold-start-budget 1.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from app.replay import percentile
+
+EVENT_LOOPS = ["asyncio", "uvloop"]
+
+
+def generate_updates(chats_count: int, clicks_count: int) -> list:
+    from app.callback_data import CallbackData
+
+    updates = []
+
+    def add_update(update_type: str, value: dict):
+        updates.append({"update_id": len(updates) + 1, update_type: value})
+
+    for chat_index in range(chats_count):
+        chat = {"id": -1000 - chat_index, "type": "group", "title": "chat"}
+        facilitator = {"id": 1, "first_name": "Facilitator", "username": "facilitator"}
+        add_update("message", {"message_id": 1, "chat": chat, "from": facilitator, "text": "/game benchmark"})
+        add_update("message", {"message_id": 2, "chat": chat, "from": facilitator, "text": "/poker topic"})
+
+    for click_index in range(clicks_count):
+        for chat_index in range(chats_count):
+            chat = {"id": -1000 - chat_index, "type": "group", "title": "chat"}
+            player_id = 100 + click_index % 50
+            add_update("callback_query", {
+                "id": "{}-{}".format(chat_index, click_index),
+                "from": {"id": player_id, "first_name": "Player", "username": "player{}".format(player_id)},
+                "data": CallbackData(CallbackData.ACTION_DISCUSSION_VOTE, 2, "to_estimate").encode(),
+                "message": {"message_id": 3, "chat": chat},
+            })
+
+    return updates
+
+
+def worker_main(arguments):
+    """
+    Run the bot with its regular `main` against the fake Bot API:
+    settings from the environment, event loop policy, warm start and shutdown on SIGTERM.
+    """
+    import aiotg.bot
+    aiotg.bot.API_URL = arguments.api_url
+
+    from app import bot as devpoker_bot
+
+    latencies = []
+    handled_at = []
+
+    def observe_latency(latency: float):
+        handled_at.append(time.time())
+        latencies.append(latency)
+        # Drained vote clicks skip the dispatcher, so completion is checked by handled update ids
+        if devpoker_bot.bot.update_deduplicator.get_processed_update_id() >= arguments.updates_count:
+            signal.raise_signal(signal.SIGTERM)
+
+    devpoker_bot.main(latency_observer=observe_latency)
+
+    is_uvloop = type(asyncio.get_event_loop_policy()).__module__.startswith("uvloop")
+    elapsed = handled_at[-1] - handled_at[0]
+
+    result = {
+        "event_loop": "uvloop" if is_uvloop else "asyncio",
+        "updates_count": arguments.updates_count,
+        "updates_per_second": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+        "cold_start": round(handled_at[0] - arguments.launched_at, 3),
+    }
+
+    with open(arguments.result_path, "w") as file:
+        json.dump(result, file)
+
+
+async def run_benchmark(arguments, event_loop: str) -> dict:
+    """
+    Serve synthetic updates from the fake Bot API to a fresh bot process running on `event_loop`.
+    """
+    from app.fake_bot_api import FakeBotApi
+
+    fake_bot_api = FakeBotApi(latency=arguments.api_latency)
+    await fake_bot_api.start()
+    updates = generate_updates(arguments.chats, arguments.clicks)
+    fake_bot_api.push_updates(updates)
+
+    db_file = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    db_file.close()
+    result_file = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
+    result_file.close()
+
+    environment = dict(os.environ)
+    environment.pop("DEVPOKER_BOT_RECORD_PATH", None)
+    environment.update({
+        "DEVPOKER_BOT_API_TOKEN": "benchmark",
+        "DEVPOKER_BOT_DB_PATH": db_file.name,
+        "DEVPOKER_BOT_EVENT_LOOP": event_loop,
+        "DEVPOKER_BOT_LOG_SAMPLE_RATE": "0",
+    })
+
+    launched_at = time.time()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "app.benchmark_event_loop",
+        "--worker",
+        "--api-url", fake_bot_api.url,
+        "--launched-at", str(launched_at),
+        "--updates-count", str(len(updates)),
+        "--result-path", result_file.name,
+        env=environment,
+        stdout=subprocess.DEVNULL,
+    )
+    return_code = await process.wait()
+    await fake_bot_api.stop()
+    os.unlink(db_file.name)
+
+    if return_code != 0:
+        os.unlink(result_file.name)
+        raise RuntimeError("Benchmark worker on {} event loop failed with code {}".format(event_loop, return_code))
+
+    with open(result_file.name) as file:
+        result = json.load(file)
+    os.unlink(result_file.name)
+
+    result["requested_event_loop"] = event_loop
+
+    return result
+
+
+def find_over_budget(results: list, cold_start_budget: float) -> list:
+    return [result for result in results if result["cold_start"] > cold_start_budget]
+
+
+def check_cold_start_budget(results: list, cold_start_budget: float):
+    """
+    Exit with code 1 when cold start of any event loop exceeds the budget.
+    """
+    over_budget = find_over_budget(results, cold_start_budget)
+    for result in over_budget:
+        print("{} cold start {}s exceeds budget {}s".format(
+            result["event_loop"],
+            result["cold_start"],
+            cold_start_budget,
+        ))
+
+    if over_budget:
+        sys.exit(1)
+
+
+def benchmark_main(arguments):
+    results = [asyncio.run(run_benchmark(arguments, event_loop)) for event_loop in EVENT_LOOPS]
+
+    print(json.dumps(results, indent=2))
+    print()
+    print("{:<10} {:>12} {:>12} {:>12} {:>12}".format("loop", "updates/s", "p50, s", "p99, s", "cold start, s"))
+    for result in results:
+        print("{:<10} {:>12} {:>12} {:>12} {:>12}".format(
+            result["event_loop"],
+            result["updates_per_second"],
+            result["latency_p50"],
+            result["latency_p99"],
+            result["cold_start"],
+        ))
+
+    if arguments.cold_start_budget is not None:
+        check_cold_start_budget(results, arguments.cold_start_budget)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare asyncio and uvloop event loops")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--clicks", type=int, default=250, help="vote clicks per chat")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="fake Bot API response delay, seconds")
+    parser.add_argument("--cold-start-budget", type=float, help="fail when cold start exceeds it, seconds")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--api-url", help=argparse.SUPPRESS)
+    parser.add_argument("--updates-count", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--launched-at", type=float, default=0.0, help=argparse.SUPPRESS)
+    parser.add_argument("--result-path", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.worker:
+        worker_main(arguments)
+    else:
+        benchmark_main(arguments)
+
+
+if __name__ == "__main__":
+    main()
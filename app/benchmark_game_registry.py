@@ -0,0 +1,313 @@
+"""
+Measure how `GameRegistry` queries degrade as game history grows.
+
+Synthetic history is generated into a temporary SQLite file and grown size by size.
+Chats are skewed by Zipf law, so a few chats own most of the games, like in production.
+Caches are cleared before every call, so the database path is measured.
+Query plans of every method are recorded with `EXPLAIN QUERY PLAN` at every size.
+
+Usage:
+    python -m app.benchmark_game_registry --sizes 10000,100000,1000000 --output registry.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+SESSIONS_PER_GAME = 20
+FACILITATORS_PER_CHAT = 5
+ACTIVE_GAMES_SHARE = 0.05
+UNRESOLVED_SESSIONS_SHARE = 0.02
+VOTERS_PER_SESSION = 6
+INSERT_CHUNK_SIZE = 50000
+
+
+class HistoryGenerator:
+    """
+    Appends synthetic games and game sessions, message ids grow like in real chats.
+    """
+
+    def __init__(self, db_path: str, chats_count: int, skew: float, seed: int):
+        self.db_connection = sqlite3.connect(db_path)
+        self.random = random.Random(seed)
+        self.chat_ids = [-1000000 - chat_index for chat_index in range(chats_count)]
+        self.chat_weights = list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(chats_count)))
+        self.message_id = 0
+        self.games_count = 0
+        self.game_sessions_count = 0
+
+    def grow(self, game_sessions_count: int):
+        while self.game_sessions_count < game_sessions_count:
+            chunk_size = min(INSERT_CHUNK_SIZE, game_sessions_count - self.game_sessions_count)
+            self.insert_chunk(chunk_size)
+
+        self.db_connection.execute("ANALYZE")
+        self.db_connection.commit()
+
+    def insert_chunk(self, game_sessions_count: int):
+        games = []
+        game_sessions = []
+        games_count = max(1, game_sessions_count // SESSIONS_PER_GAME)
+        chat_ids = self.random.choices(self.chat_ids, cum_weights=self.chat_weights, k=games_count)
+
+        for chat_id in chat_ids:
+            self.games_count += 1
+            self.message_id += 2
+            facilitator_id = -chat_id * 10 + self.random.randrange(FACILITATORS_PER_CHAT)
+            facilitator = {"id": facilitator_id, "first_name": "Facilitator", "username": "f{}".format(facilitator_id)}
+            is_active = self.random.random() < ACTIVE_GAMES_SHARE
+            games.append((
+                self.games_count,
+                chat_id,
+                facilitator_id,
+                self.message_id - 1,
+                self.message_id,
+                "started" if is_active else "ended",
+                "Sprint {}".format(self.games_count),
+                json.dumps({"facilitator": facilitator}),
+            ))
+
+            for _ in range(SESSIONS_PER_GAME):
+                if len(game_sessions) == game_sessions_count:
+                    break
+                self.message_id += 2
+                is_resolved = self.random.random() >= UNRESOLVED_SESSIONS_SHARE
+                game_sessions.append((
+                    self.games_count,
+                    chat_id,
+                    facilitator_id,
+                    self.message_id - 1,
+                    self.message_id,
+                    "resolution" if is_resolved else "estimation",
+                    "https://issue.tracker/TASK-{}".format(self.message_id),
+                    self.render_game_session_json_data(facilitator),
+                ))
+
+        self.db_connection.executemany(
+            """
+                INSERT INTO game
+                (id, chat_id, facilitator_id, facilitator_message_id, system_message_id, status, name, json_data, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'))
+            """,
+            games,
+        )
+        self.db_connection.executemany(
+            """
+                INSERT INTO game_session
+                (game_id, chat_id, facilitator_id, facilitator_message_id, system_message_id, phase, topic, json_data, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), datetime('now'))
+            """,
+            game_sessions,
+        )
+        self.db_connection.commit()
+        self.game_sessions_count += len(game_sessions)
+
+    def render_game_session_json_data(self, facilitator: dict) -> str:
+        voters = ["@u{} (User)".format(self.random.randrange(100000)) for _ in range(VOTERS_PER_SESSION)]
+
+        return json.dumps({
+            "facilitator": facilitator,
+            "discussion_votes": {voter: {"vote": "to_estimate"} for voter in voters},
+            "estimation_votes": {voter: {"vote": self.random.choice(["1", "2", "3", "5", "8"]), "version": 0} for voter in voters},
+        })
+
+    def sample_rows(self, table: str, columns: str, count: int) -> list:
+        """
+        Rows picked by random ids, so samples follow the chats skew.
+        """
+        max_id = self.db_connection.execute("SELECT MAX(id) FROM {}".format(table)).fetchone()[0]
+        query = "SELECT {} FROM {} WHERE id = ?".format(columns, table)
+
+        return [self.db_connection.execute(query, (self.random.randint(1, max_id),)).fetchone() for _ in range(count)]
+
+    def explain(self, statement: str) -> list:
+        return [row[3] for row in self.db_connection.execute("EXPLAIN QUERY PLAN " + statement)]
+
+    def close(self):
+        self.db_connection.close()
+
+
+async def measure(game_registry, calls: list, statements: list) -> dict:
+    """
+    Time every call with empty caches, return latency percentiles and statements executed by the method.
+    """
+    from app.replay import percentile
+
+    latencies = []
+    statements.clear()
+
+    for call in calls:
+        game_registry.games.clear()
+        game_registry.active_games.clear()
+        game_registry.game_sessions.clear()
+        started_at = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - started_at)
+
+    method_statements = []
+    for statement in statements:
+        if statement.split()[0].upper() in ("BEGIN", "COMMIT", "ROLLBACK") or statement.strip() in method_statements:
+            continue
+        method_statements.append(statement.strip())
+
+    return {
+        "calls_count": len(latencies),
+        "latency_mean": round(sum(latencies) / len(latencies), 6),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+        "statements": method_statements[:1],
+    }
+
+
+async def benchmark_size(db_path: str, generator: HistoryGenerator, arguments) -> dict:
+    from app.game import Game
+    from app.game_registry import GameRegistry
+    from app.telegram_user import TelegramUser
+
+    game_registry = GameRegistry()
+    await game_registry.init_db(db_path)
+    statements = []
+    await game_registry.db_connection.set_trace_callback(statements.append)
+
+    games = generator.sample_rows("game", "chat_id, facilitator_id, id", arguments.iterations)
+    game_sessions = generator.sample_rows("game_session", "chat_id, facilitator_message_id", arguments.iterations)
+    loaded_game_sessions = []
+
+    async def find_active_game_session(chat_id, facilitator_message_id):
+        loaded_game_sessions.append(await game_registry.find_active_game_session(chat_id, facilitator_message_id))
+
+    async def get_game_statistics(game_id):
+        game = Game(None, None, None, None)
+        game.id = game_id
+        await game_registry.get_game_statistics(game)
+
+    method_calls = {
+        "find_active_game": [
+            lambda chat_id=chat_id, facilitator_id=facilitator_id: game_registry.find_active_game(
+                chat_id, TelegramUser(facilitator_id, False, "Facilitator", None, None)
+            )
+            for chat_id, facilitator_id, game_id in games
+        ],
+        "find_active_game_session": [
+            lambda row=row: find_active_game_session(*row)
+            for row in game_sessions
+        ],
+        "get_game_statistics": [
+            lambda game_id=game_id: get_game_statistics(game_id)
+            for chat_id, facilitator_id, game_id in games
+        ],
+    }
+
+    result = {
+        "game_sessions_count": generator.game_sessions_count,
+        "games_count": generator.games_count,
+        "db_size": os.path.getsize(db_path),
+        "methods": {},
+    }
+
+    for method_name, calls in method_calls.items():
+        result["methods"][method_name] = await measure(game_registry, calls, statements)
+
+    # Uses game sessions loaded above, they exist at every size
+    result["methods"]["update_game_session"] = await measure(
+        game_registry,
+        [lambda game_session=game_session: game_registry.update_game_session(game_session) for game_session in loaded_game_sessions],
+        statements,
+    )
+    result["methods"]["preload"] = await measure(game_registry, [game_registry.preload], statements)
+
+    await game_registry.db_connection.close()
+
+    for method_result in result["methods"].values():
+        method_result["query_plans"] = [generator.explain(statement) for statement in method_result["statements"]]
+
+    return result
+
+
+async def benchmark(arguments) -> list:
+    db_file = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    db_file.close()
+
+    from app.game_registry import GameRegistry
+
+    game_registry = GameRegistry()
+    await game_registry.init_db(db_file.name)
+    await game_registry.db_connection.close()
+
+    generator = HistoryGenerator(db_file.name, arguments.chats, arguments.skew, arguments.seed)
+    results = []
+
+    try:
+        for size in arguments.sizes:
+            started_at = time.monotonic()
+            generator.grow(size)
+            generation_time = time.monotonic() - started_at
+
+            result = await benchmark_size(db_file.name, generator, arguments)
+            result["generation_time"] = round(generation_time, 3)
+            results.append(result)
+    finally:
+        generator.close()
+        if arguments.keep_db:
+            print("Database kept at {}".format(db_file.name))
+        else:
+            os.unlink(db_file.name)
+
+    return results
+
+
+def print_summary(results: list):
+    print("{:<26}".format("p50 / p99, ms") + "".join("{:>22}".format(result["game_sessions_count"]) for result in results))
+
+    for method_name in results[0]["methods"]:
+        line = "{:<26}".format(method_name)
+        for result in results:
+            method_result = result["methods"][method_name]
+            line += "{:>22}".format("{:.3f} / {:.3f}".format(
+                method_result["latency_p50"] * 1000,
+                method_result["latency_p99"] * 1000,
+            ))
+        print(line)
+
+    print()
+    for method_name, method_result in results[-1]["methods"].items():
+        for query_plan in method_result["query_plans"]:
+            print("{}: {}".format(method_name, "; ".join(query_plan)))
+
+
+def parse_sizes(value: str) -> list:
+    return sorted(int(size) for size in value.split(","))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure GameRegistry queries on growing synthetic history")
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("10000,100000,1000000"),
+                        help="comma separated game session counts, e.g. 10000,100000,1000000,5000000")
+    parser.add_argument("--chats", type=int, default=5000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of chat activity")
+    parser.add_argument("--iterations", type=int, default=200, help="calls of every method at every size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    parser.add_argument("--keep-db", action="store_true", help="keep generated database for manual inspection")
+    arguments = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(benchmark(arguments))
+
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+        print()
+
+    print_summary(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Compare aiotg default HTTP session with pooled `HttpClient` through the local fake Bot API.
+
+Outgoing `editMessageText` calls are sent with the given concurrency
+while `getUpdates` long polling is running in the background, as in production.
+Updates are pushed to the fake Bot API during the burst, delivery latency is the time
+until long polling returns them, it grows when polling waits for a connection behind outgoing calls.
+
+Usage:
+    python -m app.benchmark_http_client --calls 4000 --concurrency 200 --api-latency 0.02
+"""
+import argparse
+import asyncio
+import json
+import time
+
+CLIENTS = ["aiotg", "pooled"]
+
+
+async def run_client(client: str, arguments) -> dict:
+    from app.dispatching_bot import DispatchingBot
+    from app.fake_bot_api import FakeBotApi
+    from app.http_client import HttpClient
+    from app.replay import percentile
+    from app.update_dispatcher import UpdateDispatcher
+    import aiotg.bot
+
+    fake_bot_api = FakeBotApi(latency=arguments.api_latency)
+    await fake_bot_api.start()
+    aiotg.bot.API_URL = fake_bot_api.url
+
+    bot = DispatchingBot("benchmark", UpdateDispatcher())
+    bot.api_timeout = arguments.polling_timeout
+    if client == "pooled":
+        bot.http_client = HttpClient(arguments.pool_size)
+
+    pushed_at = {}
+    delivery_latencies = []
+
+    def process_updates(updates: dict):
+        for update in updates["result"]:
+            bot._offset = max(bot._offset, update["update_id"])
+            delivery_latencies.append(time.monotonic() - pushed_at[update["update_id"]])
+
+    bot._process_updates = process_updates
+    polling = asyncio.ensure_future(bot.loop())
+    semaphore = asyncio.Semaphore(arguments.concurrency)
+    latencies = []
+    is_sending = True
+
+    async def push_updates():
+        while is_sending:
+            update_id = len(pushed_at) + 1
+            pushed_at[update_id] = time.monotonic()
+            fake_bot_api.push_updates([{"update_id": update_id}])
+            await asyncio.sleep(arguments.push_interval)
+
+    async def edit_message(index: int):
+        async with semaphore:
+            started_at = time.monotonic()
+            await bot.edit_message_text(-1000 - index % 100, 1, "text {}".format(index))
+            latencies.append(time.monotonic() - started_at)
+
+    # Let the first long polling request reach the server before the burst
+    await asyncio.sleep(0.1)
+    pushing = asyncio.ensure_future(push_updates())
+    started_at = time.monotonic()
+    await asyncio.gather(*[edit_message(index) for index in range(arguments.calls)])
+    elapsed = time.monotonic() - started_at
+    is_sending = False
+    await pushing
+
+    bot.stop()
+    polling.cancel()
+    await bot.close()
+    await fake_bot_api.stop()
+
+    result = {
+        "client": client,
+        "calls_count": arguments.calls,
+        "calls_per_second": round(arguments.calls / elapsed, 1),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+        "latency_max": round(max(latencies), 6),
+        "delivery_latency_p50": percentile(delivery_latencies, 50),
+        "delivery_latency_p99": percentile(delivery_latencies, 99),
+    }
+    if bot.http_client is not None:
+        result["http_pools"] = bot.http_client.get_stats()
+
+    return result
+
+
+async def benchmark(arguments) -> list:
+    results = []
+
+    for client in CLIENTS:
+        results.append(await run_client(client, arguments))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare aiotg default HTTP session with pooled HTTP client")
+    parser.add_argument("--calls", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=32)
+    parser.add_argument("--api-latency", type=float, default=0.02, help="fake Bot API response delay, seconds")
+    parser.add_argument("--polling-timeout", type=int, default=5, help="getUpdates long polling timeout, seconds")
+    parser.add_argument("--push-interval", type=float, default=0.05, help="interval between pushed updates, seconds")
+    arguments = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(benchmark(arguments))
+
+    print(json.dumps(results, indent=2))
+    print()
+    print("{:<10} {:>10} {:>10} {:>10} {:>10} {:>16} {:>16}".format(
+        "client", "calls/s", "p50, s", "p99, s", "max, s", "delivery p50, s", "delivery p99, s",
+    ))
+    for result in results:
+        print("{:<10} {:>10} {:>10} {:>10} {:>10} {:>16} {:>16}".format(
+            result["client"],
+            result["calls_per_second"],
+            result["latency_p50"],
+            result["latency_p99"],
+            result["latency_max"],
+            result["delivery_latency_p50"],
+            result["delivery_latency_p99"],
+        ))
+
+
+if __name__ == "__main__":
+    main()
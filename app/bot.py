@@ -1,15 +1,40 @@
-from aiotg import Bot, Chat, CallbackQuery, BotApiError
-from app.utils import init_logging
+from __future__ import annotations
+from app.utils import init_logging, install_event_loop_policy
 from app.telegram_user import TelegramUser
 from app.game import Game
 from app.game_registry import GameRegistry
 from app.game_session import GameSession
+from app.chat_rate_limiter import ChatRateLimiter
+from app.callback_data import CallbackData
+from app.update_dispatcher import UpdateDispatcher
+from app.handler_registry import HandlerRegistry
+from app.update_deduplicator import UpdateDeduplicator
+from app.memory_inspector import MemoryInspector
+from app.transition import Transition
+from app.card_deck import CardDeck
 import asyncio
+import collections
+import io
 import logbook
 import os
-
-BOT_API_TOKEN = os.environ["DEVPOKER_BOT_API_TOKEN"]
-DB_PATH = os.environ["DEVPOKER_BOT_DB_PATH"]
+import signal
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    from aiotg import Chat, CallbackQuery
+
+# Settings are read from the environment by `load_config`, importing this module has no side effects
+BOT_API_TOKEN = None
+DB_PATH = None
+RECORD_PATH = None
+EVENT_LOOP = None
+LOG_SAMPLE_RATE = None
+HTTP_POOL_SIZE = None
+HTTP_KEEPALIVE_TIMEOUT = None
+ACTIVE_GAMES_CACHE_SIZE = None
+GAME_SESSIONS_CACHE_SIZE = None
+ADMIN_USER_IDS = None
 
 GREETING = """
 To start *Planning Poker* use /poker command\.
@@ -26,6 +51,12 @@ Add any description after the command to provide context\.
 Design DevPoker bot keyboard layout
 ```
 
+*Example with many topics at once \(one topic per line\):*
+```
+/poker_bulk https://issue\.tracker/TASK-123
+https://issue\.tracker/TASK-124
+```
+
 Discussion phase votes:
 \* 👍 — Ready to estimate
 \* ⁉️ — I have a questions or something to add
@@ -34,7 +65,12 @@ Discussion phase votes:
 \* ♾️ — Impossible to estimate or task cannot be completed
 \* ☕️ — I need a break
 
-Currently, there is only one sequence of numbers from 0\.5 to 36\.
+Estimation cards are chosen per chat with /deck command:
+```
+/deck fibonacci
+/deck custom 1 2 3 5 8
+```
+Available decks: default \(0\.5 to 36\), fibonacci, tshirt, powers \(of two\) and custom\.
 
 Special cases:
 \* ❓ — Unsure how to estimate \(out of context, never solved such tasks\)
@@ -42,19 +78,30 @@ Special cases:
 [Discussions on GitHub](https://github.com/cybercog/telegram-devpoker-bot/discussions)
 """
 
-bot = Bot(BOT_API_TOKEN)
-game_registry = GameRegistry()
-init_logging()
-FACILITATOR_OPERATIONS = [
-    GameSession.OPERATION_START_ESTIMATION,
-    GameSession.OPERATION_END_ESTIMATION,
-    GameSession.OPERATION_CLEAR_VOTES,
-    GameSession.OPERATION_RE_ESTIMATE,
-]
-
-
-@bot.command("/start")
-@bot.command("/?help")
+# Created by `create_app`, importing the module has no side effects
+handlers = HandlerRegistry()
+update_dispatcher = None
+bot = None
+game_registry = None
+chat_rate_limiter = None
+log_handler = None
+memory_inspector = None
+# Long running work started by handlers, kept referenced until it finishes
+background_tasks = set()
+BULK_TOPICS_LIMIT = 50
+# Telegram accepts documents up to 50 MB from bots
+EXPORT_CHUNK_SIZE = 20 * 1024 * 1024
+EXPORT_USAGE = """Usage: /export [games|sessions|votes] [csv|jsonl] [since YYYY-MM-DD] [until YYYY-MM-DD]"""
+CHAT_ADMIN_STATUSES = ["creator", "administrator"]
+DECK_USAGE = """Usage: /deck [default|fibonacci|tshirt|powers|custom CARD CARD ...]"""
+STATS_INTERVAL = 60
+MEMORY_REPORT_LIMIT = 15
+MEMORY_REPORT_TYPES = ["Game", "GameSession", "TelegramUser", "Task"]
+LAST_UPDATE_ID_SAVE_INTERVAL = 5
+
+
+@handlers.command("/start")
+@handlers.command("/?help")
 async def on_help_command(chat: Chat, match):
     await chat.send_text(
         GREETING,
@@ -63,8 +110,8 @@ async def on_help_command(chat: Chat, match):
     )
 
 
-@bot.command("(?s)/game\s+(.+)$")
-@bot.command("/(game)$")
+@handlers.command("(?s)/game\s+(.+)$")
+@handlers.command("/(game)$")
 async def on_game_command(chat: Chat, match):
     chat_id = chat.id
     facilitator_message_id = str(chat.message["message_id"])
@@ -85,7 +132,7 @@ async def on_game_command(chat: Chat, match):
     await create_game(chat, game)
 
 
-@bot.command("/game_end$")
+@handlers.command("/game_end$")
 async def on_game_end_command(chat: Chat, match):
     chat_id = chat.id
     facilitator = TelegramUser.from_dict(chat.sender)
@@ -101,8 +148,32 @@ async def on_game_end_command(chat: Chat, match):
     await end_game(chat, active_game)
 
 
-@bot.command("(?s)/poker\s+(.+)$")
-@bot.command("/(poker)$")
+@handlers.command(r"(?s)/poker_bulk\s+(.+)$")
+async def on_poker_bulk_command(chat: Chat, match):
+    chat_id = chat.id
+    facilitator_message_id = chat.message["message_id"]
+    topics = [topic.strip() for topic in match.group(1).splitlines() if topic.strip()]
+    facilitator = TelegramUser.from_dict(chat.sender)
+
+    if len(topics) > BULK_TOPICS_LIMIT:
+        await chat.send_text(
+            text="Too many topics. Up to {} topics can be added at once.".format(BULK_TOPICS_LIMIT)
+        )
+        return
+
+    game = await game_registry.find_active_game(chat_id, facilitator)
+    card_deck = await game_registry.find_chat_card_deck(chat_id)
+
+    game_sessions = [
+        GameSession(game, chat_id, bulk_facilitator_message_id(facilitator_message_id, topic_index), topic, facilitator, card_deck)
+        for topic_index, topic in enumerate(topics)
+    ]
+    # Pacing takes minutes for a long list, next updates of the chat are not held behind it
+    run_in_background(create_game_sessions(chat, game_sessions), "posting game sessions of chat {}".format(chat_id))
+
+
+@handlers.command("(?s)/poker\s+(.+)$")
+@handlers.command("/(poker)$")
 async def on_poker_command(chat: Chat, match):
     chat_id = chat.id
     facilitator_message_id = str(chat.message["message_id"])
@@ -113,67 +184,119 @@ async def on_poker_command(chat: Chat, match):
         topic = "(no topic)"
 
     game = await game_registry.find_active_game(chat_id, facilitator)
+    card_deck = await game_registry.find_chat_card_deck(chat_id)
 
-    game_session = GameSession(game, chat_id, facilitator_message_id, topic, facilitator)
+    game_session = GameSession(game, chat_id, facilitator_message_id, topic, facilitator, card_deck)
     await create_game_session(chat, game_session)
 
 
-@bot.callback(r"discussion-vote-click-(.*?)-(.*?)$")
-async def on_discussion_vote_click(chat: Chat, callback_query: CallbackQuery, match):
-    logbook.info("{}", callback_query)
-    facilitator_message_id = int(match.group(1))
-    vote = match.group(2)
-    result = "Vote `{}` accepted".format(vote)
-    game_session = await game_registry.find_active_game_session(chat.id, facilitator_message_id)
-
-    if not game_session:
-        return await callback_query.answer(text="No such game session")
+@handlers.command(r"/deck(?:\s+(\w+)(?:\s+(.+))?)?$")
+async def on_deck_command(chat: Chat, match):
+    name = match.group(1)
+    cards = None
 
-    if game_session.phase not in GameSession.PHASE_DISCUSSION:
-        return await callback_query.answer(text="Can't vote not in " + GameSession.PHASE_DISCUSSION + " phase")
+    if name is None:
+        card_deck = await game_registry.find_chat_card_deck(chat.id)
+        await chat.send_text(text=render_card_deck_text(card_deck))
+        return
 
-    if not game_session.game.is_active():
-        return await callback_query.answer(text="Game already ended")
+    if not await is_chat_admin(chat, TelegramUser.from_dict(chat.sender)):
+        await chat.send_text(text="Deck can be changed only by administrators of this chat.")
+        return
 
-    game_session.add_discussion_vote(callback_query.src["from"], vote)
-    await game_registry.update_game_session(game_session)
+    name = name.lower()
+    if name not in CardDeck.NAMES:
+        await chat.send_text(text=DECK_USAGE)
+        return
 
-    await edit_message(chat, game_session)
+    if name == CardDeck.NAME_CUSTOM:
+        try:
+            cards = CardDeck.parse_custom_cards(match.group(2) or "")
+        except ValueError as error:
+            await chat.send_text(text="{}.\n{}".format(error, DECK_USAGE))
+            return
 
-    await callback_query.answer(text=result)
+    card_deck = CardDeck.get(name, cards)
+    await game_registry.save_chat_card_deck(chat.id, card_deck)
+    await chat.send_text(text="New estimations will use this deck.\n" + render_card_deck_text(card_deck))
 
 
-@bot.callback(r"estimation-vote-click-(.*?)-(.*?)$")
-async def on_estimation_vote_click(chat: Chat, callback_query: CallbackQuery, match):
-    logbook.info("{}", callback_query)
-    chat_id = chat.id
-    facilitator_message_id = int(match.group(1))
-    vote = match.group(2)
-    result = "Vote `{}` accepted".format(vote)
-    game_session = await game_registry.find_active_game_session(chat_id, facilitator_message_id)
+def render_card_deck_text(card_deck: CardDeck) -> str:
+    return "Deck: {}\nCards: {}".format(card_deck.name, " ".join(card_deck.cards))
 
-    if not game_session:
-        return await callback_query.answer(text="No such game session")
 
-    if game_session.phase not in GameSession.PHASE_ESTIMATION:
-        return await callback_query.answer(text="Can't vote not in " + GameSession.PHASE_ESTIMATION + " phase")
+@handlers.command(r"/export(?:\s+(.*))?$")
+async def on_export_command(chat: Chat, match):
+    user = TelegramUser.from_dict(chat.sender)
+    arguments = (match.group(1) or "").split()
 
-    if not game_session.game.is_active():
-        return await callback_query.answer(text="Game already ended")
+    if not await is_chat_admin(chat, user):
+        await chat.send_text(text="Export is available only for administrators of this chat.")
+        return
 
-    game_session.add_estimation_vote(callback_query.src["from"], vote)
-    await game_registry.update_game_session(game_session)
+    try:
+        kind, output_format, since, until = parse_export_arguments(arguments)
+    except ValueError:
+        await chat.send_text(text=EXPORT_USAGE)
+        return
 
-    await edit_message(chat, game_session)
+    # Upload of a large history takes long, next updates of the chat are not held behind it
+    run_in_background(export_history(chat, kind, output_format, since, until), "exporting history of chat {}".format(chat.id))
 
-    await callback_query.answer(text=result)
 
+@handlers.command(r"/memory(?:\s+(start|stop))?$")
+async def on_memory_command(chat: Chat, match):
+    user = TelegramUser.from_dict(chat.sender)
+    if user.id not in ADMIN_USER_IDS:
+        return
 
-@bot.callback(r"({})-click-(.*?)$".format("|".join(FACILITATOR_OPERATIONS)))
-async def on_facilitator_operation_click(chat: Chat, callback_query: CallbackQuery, match):
     operation = match.group(1)
+    if operation == "start":
+        memory_inspector.start_tracing()
+    elif operation == "stop":
+        memory_inspector.stop_tracing()
+
+    await chat.send_text(text=GameSession.truncate_text(render_memory_report(), GameSession.MESSAGE_TEXT_LIMIT))
+
+
+@handlers.callback(r"^")
+async def on_callback_query(chat: Chat, callback_query: CallbackQuery, match):
+    callback_data = CallbackData.decode(callback_query.data)
+    if callback_data is None:
+        return
+
+    callback_handler = CALLBACK_HANDLERS.get(callback_data.action)
+    if callback_handler is None:
+        return
+
+    started_at = time.monotonic()
+    await callback_handler(chat, callback_query, callback_data)
+    logbook.info(
+        "Callback query handled",
+        extra={
+            "chat_id": chat.id,
+            "game_session_id": callback_data.facilitator_message_id,
+            "handler": callback_handler.__name__,
+            "duration": round(time.monotonic() - started_at, 6),
+            "sampled": True,
+        },
+    )
+
+
+async def on_discussion_vote_click(chat: Chat, callback_query: CallbackQuery, callback_data: CallbackData):
+    vote_clicks = [(callback_query, callback_data.vote)]
+    await run_vote_clicks(chat, callback_data.facilitator_message_id, GameSession.PHASE_DISCUSSION, vote_clicks)
+
+
+async def on_estimation_vote_click(chat: Chat, callback_query: CallbackQuery, callback_data: CallbackData):
+    vote_clicks = [(callback_query, callback_data.vote)]
+    await run_vote_clicks(chat, callback_data.facilitator_message_id, GameSession.PHASE_ESTIMATION, vote_clicks)
+
+
+async def on_facilitator_operation_click(chat: Chat, callback_query: CallbackQuery, callback_data: CallbackData):
+    operation = callback_data.action
     chat_id = chat.id
-    facilitator_message_id = int(match.group(2))
+    facilitator_message_id = callback_data.facilitator_message_id
     game_session = await game_registry.find_active_game_session(chat_id, facilitator_message_id)
 
     if not game_session:
@@ -185,52 +308,168 @@ async def on_facilitator_operation_click(chat: Chat, callback_query: CallbackQue
     if not game_session.game.is_active():
         return await callback_query.answer(text="Game already ended")
 
-    if operation in GameSession.OPERATION_START_ESTIMATION:
-        await run_operation_start_estimation(chat, game_session)
-    elif operation in GameSession.OPERATION_END_ESTIMATION:
-        await run_operation_end_estimation(chat, game_session)
-    elif operation in GameSession.OPERATION_CLEAR_VOTES:
-        await run_operation_clear_votes(chat, game_session)
-    elif operation in GameSession.OPERATION_RE_ESTIMATE:
-        await run_re_estimate(chat, game_session)
-    else:
-        raise Exception("Unknown operation `{}`".format(operation))
+    await FACILITATOR_OPERATION_HANDLERS[operation](chat, game_session)
 
     await callback_query.answer()
 
 
-async def run_operation_start_estimation(chat: Chat, game_session: GameSession):
-    game_session.start_estimation()
-    await edit_message(chat, game_session)
+async def run_vote_clicks(chat: Chat, facilitator_message_id: int, phase: str, vote_clicks: list):
+    if phase == GameSession.PHASE_ESTIMATION:
+        vote_clicks = await reject_invalid_votes(vote_clicks, CardDeck.is_possible_vote)
+        if not vote_clicks:
+            return
+
+    game_session = await game_registry.find_active_game_session(chat.id, facilitator_message_id)
+
+    if not game_session:
+        return await answer_callback_queries(vote_clicks, "No such game session")
+
+    if game_session.phase not in phase:
+        return await answer_callback_queries(vote_clicks, "Can't vote not in " + phase + " phase")
+
+    if game_session.game is not None and not game_session.game.is_active():
+        return await answer_callback_queries(vote_clicks, "Game already ended")
+
+    if phase == GameSession.PHASE_ESTIMATION:
+        vote_clicks = await reject_invalid_votes(vote_clicks, game_session.card_deck.is_valid_vote)
+        if not vote_clicks:
+            return
+
+    for callback_query, vote in vote_clicks:
+        if phase in GameSession.PHASE_DISCUSSION:
+            game_session.add_discussion_vote(callback_query.src["from"], vote)
+        else:
+            game_session.add_estimation_vote(callback_query.src["from"], vote)
+
     await game_registry.update_game_session(game_session)
 
+    await edit_message(chat, game_session)
+
+    await asyncio.gather(
+        *[
+            answer_callback_query(callback_query, "Vote `{}` accepted".format(vote))
+            for callback_query, vote in vote_clicks
+        ]
+    )
+
+
+async def reject_invalid_votes(vote_clicks: list, is_valid_vote) -> list:
+    """
+    Answer clicks on cards which are not in the deck, e.g. buttons of a stale keyboard,
+    and return the rest of vote clicks.
+    """
+    valid_vote_clicks = []
+    invalid_vote_clicks = []
+
+    for vote_click in vote_clicks:
+        if is_valid_vote(vote_click[1]):
+            valid_vote_clicks.append(vote_click)
+        else:
+            invalid_vote_clicks.append(vote_click)
+
+    await asyncio.gather(
+        *[
+            answer_callback_query(callback_query, "Card `{}` is not in the deck".format(vote))
+            for callback_query, vote in invalid_vote_clicks
+        ]
+    )
+
+    return valid_vote_clicks
+
+
+async def answer_callback_queries(vote_clicks: list, text: str):
+    await asyncio.gather(
+        *[
+            answer_callback_query(callback_query, text)
+            for callback_query, vote in vote_clicks
+        ]
+    )
+
+
+async def answer_callback_query(callback_query: CallbackQuery, text: str):
+    """
+    Answer is only a notification for the voter, Telegram rejects answers to queries
+    older than about 15 seconds, e.g. clicks queued while the bot was offline.
+    """
+    from aiotg import BotApiError
+
+    try:
+        await callback_query.answer(text=text)
+    except BotApiError as error:
+        logbook.warning("Callback query {} not answered: {}", callback_query.query_id, error)
+
+
+async def run_operation_start_estimation(chat: Chat, game_session: GameSession):
+    await run_game_session_transition(chat, game_session, game_session.start_estimation)
+
 
 async def run_operation_clear_votes(chat: Chat, game_session: GameSession):
-    game_session.clear_votes()
-    await edit_message(chat, game_session)
-    await game_registry.update_game_session(game_session)
+    await run_game_session_transition(chat, game_session, game_session.clear_votes)
 
 
 async def run_operation_end_estimation(chat: Chat, game_session: GameSession):
-    game_session.end_estimation()
-    await edit_message(chat, game_session)
-    await game_registry.update_game_session(game_session)
+    await run_game_session_transition(chat, game_session, game_session.end_estimation)
+
+
+async def run_game_session_transition(chat: Chat, game_session: GameSession, operation):
+    """
+    Apply the operation, then edit the message and save the game session concurrently.
+    When saving fails, the message is edited back and the changed game session is dropped
+    from the cache, so it is loaded again in the saved state.
+    """
+    previous_message = game_session.render_system_message()
+    operation()
+
+    try:
+        await Transition().run(
+            (
+                edit_message(chat, game_session),
+                lambda result: edit_message_text(chat, game_session.system_message_id, previous_message),
+            ),
+            (
+                game_registry.update_game_session(game_session),
+                None,
+            ),
+        )
+    except Exception:
+        game_registry.forget_game_session(game_session)
+        raise
 
 
 async def run_re_estimate(chat: Chat, game_session: GameSession):
+    """
+    Remove buttons from the resolved message and post a new message for the same topic concurrently,
+    then save the new game session. When posting or saving fails, the new message is deleted,
+    the resolved message gets its buttons back and the changed game session is dropped from the cache,
+    so the resolved game session is loaded again from the database.
+    """
+    previous_system_message_id = game_session.system_message_id
+    previous_message = game_session.render_system_message()
     message = {
         "text": game_session.render_system_message_text(),
     }
 
     game_session.re_estimate()
 
-    # TODO: Extract to method
+    transition = Transition()
     try:
-        await bot.edit_message_text(chat.id, game_session.system_message_id, **message)
-    except BotApiError:
-        logbook.exception("Error when updating markup")
-
-    await create_game_session(chat, game_session)
+        _, response = await transition.run(
+            (
+                edit_message_text(chat, previous_system_message_id, message),
+                lambda result: edit_message_text(chat, previous_system_message_id, previous_message),
+            ),
+            (
+                chat.send_text(**game_session.render_system_message()),
+                lambda response: delete_message(chat, response["result"]["message_id"]),
+            ),
+        )
+        game_session.system_message_id = response["result"]["message_id"]
+        await transition.run(
+            (game_registry.create_game_session(game_session), None),
+        )
+    except Exception:
+        game_registry.forget_game_session(game_session)
+        raise
 
 
 async def create_game(chat: Chat, game_prototype: Game):
@@ -240,10 +479,34 @@ async def create_game(chat: Chat, game_prototype: Game):
 
 
 async def end_game(chat: Chat, game: Game):
+    """
+    Statistics do not depend on the game status, so they are read first
+    and the results message is posted while the ended game is saved.
+    When either of them fails, the other one is undone and the game stays active.
+    """
+    game_statistics = await game_registry.get_game_statistics(game)
     game.end()
+
+    try:
+        await Transition().run(
+            (
+                game_registry.update_game(game),
+                lambda result: restart_game(game),
+            ),
+            (
+                chat.send_text(**game.render_results_system_message(game_statistics)),
+                lambda response: delete_message(chat, response["result"]["message_id"]),
+            ),
+        )
+    except Exception:
+        game.start()
+        game_registry.remember_game(game)
+        raise
+
+
+async def restart_game(game: Game):
+    game.start()
     await game_registry.update_game(game)
-    game_statistics = await game_registry.get_game_statistics(game)
-    await chat.send_text(**game.render_results_system_message(game_statistics))
 
 
 async def create_game_session(chat: Chat, game_session_prototype: GameSession):
@@ -252,17 +515,455 @@ async def create_game_session(chat: Chat, game_session_prototype: GameSession):
     await game_registry.create_game_session(game_session_prototype)
 
 
+async def create_game_sessions(chat: Chat, game_session_prototypes: list):
+    """
+    Post game sessions paced under the chat rate limit, every game session is persisted
+    right after it is posted, so a failed post or restart never leaves a message without its row
+    and votes for already posted game sessions are saved.
+    """
+    for game_session_prototype in game_session_prototypes:
+        await chat_rate_limiter.wait(chat.id)
+        await create_game_session(chat, game_session_prototype)
+
+
+def run_in_background(coro, description: str):
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(lambda task: finish_background_task(task, description))
+
+
+def finish_background_task(task: asyncio.Task, description: str):
+    background_tasks.discard(task)
+
+    if task.cancelled():
+        logbook.warning("Cancelled {}", description)
+        return
+
+    error = task.exception()
+    if error is not None:
+        logbook.error("Error when {}", description, exc_info=(type(error), error, error.__traceback__))
+
+
+def bulk_facilitator_message_id(facilitator_message_id: int, topic_index: int) -> int:
+    # All topics share one command message, topic index is kept above the 32-bit message id,
+    # so the first topic keeps the original message id and others never clash with real messages
+    return (topic_index << 32) | facilitator_message_id
+
+
 async def edit_message(chat: Chat, game_session: GameSession):
+    await edit_message_text(chat, game_session.system_message_id, game_session.render_system_message())
+
+
+async def edit_message_text(chat: Chat, message_id: int, message: dict):
+    from aiotg import BotApiError
+
     try:
-        await bot.edit_message_text(chat.id, game_session.system_message_id, **game_session.render_system_message())
+        await bot.edit_message_text(chat.id, message_id, **message)
     except BotApiError:
         logbook.exception("Error when updating markup")
 
 
-def main():
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(game_registry.init_db(DB_PATH))
-    bot.run(reload=False)
+async def delete_message(chat: Chat, message_id: int):
+    await bot.api_call("deleteMessage", chat_id=chat.id, message_id=message_id)
+
+
+async def is_chat_admin(chat: Chat, user: TelegramUser) -> bool:
+    """
+    Chat wide settings and history belong to chat administrators, in private chats to the user.
+    """
+    from aiotg import BotApiError
+
+    if chat.type == "private":
+        return True
+
+    try:
+        response = await chat.get_chat_member(user.id)
+    except BotApiError:
+        return False
+
+    return response["result"]["status"] in CHAT_ADMIN_STATUSES
+
+
+def parse_export_arguments(arguments: list):
+    """
+    Optional kind and format, then optional `since YYYY-MM-DD` and `until YYYY-MM-DD`.
+    """
+    from app.history_exporter import HistoryExporter
+
+    positional_arguments = []
+    dates = {"since": None, "until": None}
+    arguments = iter(arguments)
+
+    for argument in arguments:
+        if argument in dates:
+            dates[argument] = HistoryExporter.parse_date(next(arguments, ""))
+        elif any(dates.values()):
+            raise ValueError("Kind and format go before dates")
+        else:
+            positional_arguments.append(argument)
+
+    kind = positional_arguments[0] if len(positional_arguments) > 0 else HistoryExporter.KIND_VOTES
+    output_format = positional_arguments[1] if len(positional_arguments) > 1 else HistoryExporter.FORMAT_CSV
+
+    if kind not in HistoryExporter.KINDS or output_format not in HistoryExporter.FORMATS or len(positional_arguments) > 2:
+        raise ValueError("Invalid export arguments")
+
+    return kind, output_format, dates["since"], dates["until"]
+
+
+async def export_history(chat: Chat, kind: str, output_format: str, since: str, until: str):
+    """
+    Stream history of the chat into documents of up to `EXPORT_CHUNK_SIZE` bytes,
+    every CSV document starts with the header line.
+    """
+    from app.history_exporter import HistoryExporter
+    import aiosqlite
+
+    async with aiosqlite.connect(DB_PATH) as db_connection:
+        db_connection.row_factory = aiosqlite.Row
+        lines = HistoryExporter(db_connection).iterate_lines(kind, output_format, chat.id, since, until)
+
+        header = b""
+        chunk = io.BytesIO()
+        chunks_count = 0
+
+        async for line in lines:
+            line = line.encode("utf-8")
+
+            if output_format == HistoryExporter.FORMAT_CSV and not header:
+                header = line
+                chunk.write(header)
+                continue
+
+            if chunk.tell() + len(line) > EXPORT_CHUNK_SIZE and chunk.tell() > len(header):
+                chunks_count += 1
+                await send_export_chunk(chat, chunk, kind, output_format, chunks_count)
+                chunk = io.BytesIO()
+                chunk.write(header)
+
+            chunk.write(line)
+
+        if chunk.tell() > len(header) or chunks_count == 0:
+            chunks_count += 1
+            await send_export_chunk(chat, chunk, kind, output_format, chunks_count)
+
+
+async def send_export_chunk(chat: Chat, chunk: io.BytesIO, kind: str, output_format: str, chunk_number: int):
+    chunk.seek(0)
+    chunk.name = "devpoker-{}-{}.{}".format(kind, chunk_number, output_format)
+    await chat.send_document(chunk, caption="History export, part {}".format(chunk_number))
+
+
+async def warm_start():
+    """
+    Open the database and poll pending updates concurrently,
+    neither of them depends on the other and both are network or disk bound.
+    """
+    started_at = time.monotonic()
+    updates, _ = await asyncio.gather(
+        fetch_pending_updates(),
+        open_db(),
+    )
+    logbook.info(
+        "Preloaded {} active games and {} game sessions in {:.3f}s",
+        len(game_registry.active_games),
+        len(game_registry.game_sessions),
+        time.monotonic() - started_at,
+    )
+
+    started_at = time.monotonic()
+    try:
+        vote_clicks_count = await drain_pending_vote_clicks(updates)
+    except Exception:
+        # Bot keeps starting, the rest of the backlog is handled by the polling loop
+        logbook.exception("Error when draining pending vote clicks")
+        vote_clicks_count = 0
+    await save_last_update_id()
+    logbook.info(
+        "Drained {} pending vote clicks in {:.3f}s",
+        vote_clicks_count,
+        time.monotonic() - started_at,
+    )
+
+
+async def fetch_pending_updates() -> dict:
+    """
+    Pending updates for the drain, the polling loop fetches them again when this fails.
+    """
+    try:
+        return await bot.api_call("getUpdates", timeout=0)
+    except Exception:
+        logbook.exception("Error when fetching pending updates")
+        return {"ok": True, "result": []}
+
+
+async def open_db():
+    await game_registry.init_db(DB_PATH)
+    await game_registry.preload()
+
+    last_update_id = await game_registry.get_last_update_id()
+    bot.update_deduplicator.last_update_id = last_update_id
+    bot._offset = max(bot._offset, last_update_id)
+
+
+async def save_last_update_id():
+    """
+    Persist id of the last update which is handled along with all updates before it,
+    updates up to it are skipped when Telegram delivers them again after a restart.
+    """
+    update_id = bot.update_deduplicator.get_processed_update_id()
+    if update_id > bot.update_deduplicator.last_update_id:
+        await game_registry.save_last_update_id(update_id)
+        bot.update_deduplicator.last_update_id = update_id
+
+
+async def run_last_update_id_saving():
+    while True:
+        await asyncio.sleep(LAST_UPDATE_ID_SAVE_INTERVAL)
+        await save_last_update_id()
+
+
+async def drain_pending_vote_clicks(updates: dict) -> int:
+    """
+    Coalesce vote clicks queued while the bot was offline by game session,
+    so every game session gets a single write and a single message edit.
+    Draining stops at the first update which is not a vote click,
+    the rest of the polled batch is dispatched as usual
+    and the remaining backlog is handled by the regular polling loop in order.
+    """
+    vote_clicks_by_game_session = collections.OrderedDict()
+    vote_clicks_count = 0
+    offset = 0
+    rest_updates = []
+
+    while updates["ok"] and updates["result"]:
+        for index, update in enumerate(updates["result"]):
+            vote_click = parse_vote_click(update)
+            if vote_click is None:
+                rest_updates = updates["result"][index:]
+                break
+
+            offset = update["update_id"] + 1
+            # Same order as in the polling loop, so replay gets the drained clicks too
+            if bot.update_recorder is not None:
+                bot.update_recorder.record(update)
+            if bot.update_deduplicator.is_duplicate(update):
+                continue
+
+            chat, facilitator_message_id, phase, callback_query, vote = vote_click
+            vote_clicks_by_game_session.setdefault(
+                (chat.id, facilitator_message_id, phase),
+                (chat, []),
+            )[1].append((callback_query, vote))
+            vote_clicks_count += 1
+
+        if rest_updates:
+            break
+
+        updates = await bot.api_call("getUpdates", offset=offset, timeout=0)
+
+    # Polling loop continues with `offset + 1`, it acknowledges drained updates
+    if offset > 0:
+        bot._offset = max(bot._offset, offset - 1)
+
+    game_session_keys = list(vote_clicks_by_game_session)
+    results = await asyncio.gather(
+        *[
+            run_vote_clicks(chat, facilitator_message_id, phase, vote_clicks)
+            for (chat_id, facilitator_message_id, phase), (chat, vote_clicks) in vote_clicks_by_game_session.items()
+        ],
+        return_exceptions=True,
+    )
+    for (chat_id, facilitator_message_id, phase), result in zip(game_session_keys, results):
+        if isinstance(result, Exception):
+            logbook.error(
+                "Error when draining vote clicks of game session {} in chat {}",
+                facilitator_message_id,
+                chat_id,
+                exc_info=(type(result), result, result.__traceback__),
+            )
+
+    for update in rest_updates:
+        bot._process_update(update)
+
+    return vote_clicks_count
+
+
+def parse_vote_click(update: dict):
+    from aiotg import Chat, CallbackQuery
+
+    callback_query = update.get("callback_query")
+    if callback_query is None or "message" not in callback_query or "data" not in callback_query:
+        return None
+
+    callback_data = CallbackData.decode(callback_query["data"])
+    if callback_data is None or callback_data.action not in VOTE_CLICK_PHASES:
+        return None
+
+    return (
+        Chat.from_message(bot, callback_query["message"]),
+        callback_data.facilitator_message_id,
+        VOTE_CLICK_PHASES[callback_data.action],
+        CallbackQuery(bot, callback_query),
+        callback_data.vote,
+    )
+
+
+VOTE_CLICK_PHASES = {
+    CallbackData.ACTION_DISCUSSION_VOTE: GameSession.PHASE_DISCUSSION,
+    CallbackData.ACTION_ESTIMATION_VOTE: GameSession.PHASE_ESTIMATION,
+}
+FACILITATOR_OPERATION_HANDLERS = {
+    GameSession.OPERATION_START_ESTIMATION: run_operation_start_estimation,
+    GameSession.OPERATION_END_ESTIMATION: run_operation_end_estimation,
+    GameSession.OPERATION_CLEAR_VOTES: run_operation_clear_votes,
+    GameSession.OPERATION_RE_ESTIMATE: run_re_estimate,
+}
+CALLBACK_HANDLERS = {
+    CallbackData.ACTION_DISCUSSION_VOTE: on_discussion_vote_click,
+    CallbackData.ACTION_ESTIMATION_VOTE: on_estimation_vote_click,
+}
+CALLBACK_HANDLERS.update(
+    (operation, on_facilitator_operation_click) for operation in FACILITATOR_OPERATION_HANDLERS
+)
+
+
+def get_memory_stats() -> dict:
+    result = {
+        "rss": memory_inspector.get_rss(),
+        "tasks_count": len(asyncio.all_tasks()),
+    }
+    result.update(game_registry.get_cache_stats())
+    result.update(("chat_rate_limiter_" + name, value) for name, value in chat_rate_limiter.get_stats().items())
+    result["update_deduplicator_seen_count"] = len(bot.update_deduplicator.seen_keys)
+
+    return result
+
+
+def render_memory_report() -> str:
+    lines = ["{}: {}".format(name, value) for name, value in get_memory_stats().items()]
+
+    objects_count = memory_inspector.count_objects()
+    lines.append("")
+    lines.append("Objects by type:")
+    for type_name in MEMORY_REPORT_TYPES:
+        lines.append("{}: {}".format(type_name, objects_count[type_name]))
+    for type_name, count in objects_count.most_common(MEMORY_REPORT_LIMIT):
+        lines.append("{}: {}".format(type_name, count))
+
+    lines.append("")
+    if memory_inspector.is_tracing():
+        lines.append("Top allocations since baseline:")
+        for statistic in memory_inspector.get_top_allocations(MEMORY_REPORT_LIMIT):
+            frame = statistic.traceback[0]
+            lines.append("{}:{}: {:+d} B, {:+d} blocks".format(
+                frame.filename,
+                frame.lineno,
+                statistic.size_diff,
+                statistic.count_diff,
+            ))
+    else:
+        lines.append("Allocation tracing is off, use /memory start to take the baseline")
+
+    return "\n".join(lines)
+
+
+async def log_stats():
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        logbook.info("Update dispatcher stats", extra=update_dispatcher.get_stats())
+        logbook.info("Logging stats", extra={"dropped_count": log_handler.dropped_count})
+        logbook.info("Update deduplicator stats", extra={"skipped_count": bot.update_deduplicator.skipped_count})
+        for http_pool_stats in bot.http_client.get_stats():
+            logbook.info("HTTP pool stats", extra=http_pool_stats)
+        logbook.info("Memory stats", extra=get_memory_stats())
+
+
+def load_config():
+    global BOT_API_TOKEN, DB_PATH, RECORD_PATH, EVENT_LOOP, LOG_SAMPLE_RATE, HTTP_POOL_SIZE, HTTP_KEEPALIVE_TIMEOUT
+    global ACTIVE_GAMES_CACHE_SIZE, GAME_SESSIONS_CACHE_SIZE, ADMIN_USER_IDS
+
+    BOT_API_TOKEN = os.environ["DEVPOKER_BOT_API_TOKEN"]
+    DB_PATH = os.environ["DEVPOKER_BOT_DB_PATH"]
+    RECORD_PATH = os.environ.get("DEVPOKER_BOT_RECORD_PATH")
+    EVENT_LOOP = os.environ.get("DEVPOKER_BOT_EVENT_LOOP", "asyncio")
+    LOG_SAMPLE_RATE = float(os.environ.get("DEVPOKER_BOT_LOG_SAMPLE_RATE", "1"))
+    HTTP_POOL_SIZE = int(os.environ.get("DEVPOKER_BOT_HTTP_POOL_SIZE", "32"))
+    HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("DEVPOKER_BOT_HTTP_KEEPALIVE_TIMEOUT", "60"))
+    ACTIVE_GAMES_CACHE_SIZE = int(os.environ.get("DEVPOKER_BOT_ACTIVE_GAMES_CACHE_SIZE", "10000"))
+    GAME_SESSIONS_CACHE_SIZE = int(os.environ.get("DEVPOKER_BOT_GAME_SESSIONS_CACHE_SIZE", "10000"))
+    ADMIN_USER_IDS = {int(user_id) for user_id in os.environ.get("DEVPOKER_BOT_ADMIN_USER_IDS", "").split(",") if user_id}
+
+
+def create_app():
+    """
+    Read settings and build the bot and its collaborators. Bot API client (aiotg and aiohttp)
+    and modules which are not needed to start polling are imported here, not with this module.
+    """
+    global update_dispatcher, bot, game_registry, chat_rate_limiter, log_handler, memory_inspector
+    from app.dispatching_bot import DispatchingBot
+    from app.http_client import HttpClient
+
+    load_config()
+    log_handler = init_logging(LOG_SAMPLE_RATE)
+    update_dispatcher = UpdateDispatcher()
+    bot = DispatchingBot(BOT_API_TOKEN, update_dispatcher)
+    if RECORD_PATH:
+        from app.update_recorder import UpdateRecorder
+        bot.update_recorder = UpdateRecorder(RECORD_PATH)
+    bot.update_deduplicator = UpdateDeduplicator()
+    bot.http_client = HttpClient(HTTP_POOL_SIZE, HTTP_KEEPALIVE_TIMEOUT)
+    handlers.register(bot)
+    game_registry = GameRegistry(ACTIVE_GAMES_CACHE_SIZE, GAME_SESSIONS_CACHE_SIZE)
+    chat_rate_limiter = ChatRateLimiter()
+    memory_inspector = MemoryInspector()
+
+    return bot
+
+
+def main(import_durations: dict = None, latency_observer=None):
+    """
+    Run the bot until SIGINT or SIGTERM, `latency_observer` gets handling latency of every dispatched update.
+    """
+    started_at = time.monotonic()
+    create_app()
+    update_dispatcher.latency_observer = latency_observer
+    event_loop = install_event_loop_policy(EVENT_LOOP)
+    logbook.info("Using {} event loop", event_loop)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(warm_start())
+    logbook.info(
+        "Started in {:.3f}s",
+        time.monotonic() - started_at,
+        extra={"import_durations": import_durations or {}},
+    )
+    asyncio.ensure_future(log_stats())
+    asyncio.ensure_future(run_last_update_id_saving())
+
+    polling = asyncio.ensure_future(bot.loop())
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, polling.cancel)
+    try:
+        loop.run_until_complete(polling)
+    except asyncio.CancelledError:
+        logbook.info("Stopping")
+    finally:
+        loop.run_until_complete(shutdown())
+        loop.close()
+
+
+async def shutdown():
+    """
+    Persist progress and release resources, buffered update recordings are written out here.
+    """
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+    await save_last_update_id()
+    await bot.close()
+    await game_registry.db_connection.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,29 @@
+import collections
+
+
+class BoundedCache(collections.OrderedDict):
+    """
+    Dict which keeps at most `capacity` items,
+    the least recently stored or read with `get` item is evicted first.
+    """
+
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.capacity = capacity
+        self.evicted_count = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+
+        while len(self) > self.capacity:
+            self.popitem(last=False)
+            self.evicted_count += 1
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+
+        self.move_to_end(key)
+
+        return super().__getitem__(key)
@@ -0,0 +1,139 @@
+from app.discussion_vote import DiscussionVote
+
+
+class CallbackData:
+    ACTION_DISCUSSION_VOTE = "discussion_vote"
+    ACTION_ESTIMATION_VOTE = "estimation_vote"
+
+    # Facilitator operation actions are named after `GameSession.OPERATION_*`
+    ACTION_CODES = {
+        ACTION_DISCUSSION_VOTE: "d",
+        ACTION_ESTIMATION_VOTE: "e",
+        "start_estimation": "s",
+        "end_estimation": "n",
+        "clear_votes": "c",
+        "re_estimate": "r",
+    }
+    ACTIONS = {code: action for action, code in ACTION_CODES.items()}
+
+    DISCUSSION_VOTE_CODES = {
+        DiscussionVote.VOTE_TO_ESTIMATE: "e",
+        DiscussionVote.VOTE_NEED_DISCUSS: "d",
+        DiscussionVote.VOTE_SPLIT_TASK: "s",
+        DiscussionVote.VOTE_CANCEL_TASK: "c",
+        DiscussionVote.VOTE_ESTIMATION_IMPOSSIBLE: "i",
+        DiscussionVote.VOTE_TAKE_A_BREAK: "b",
+    }
+    DISCUSSION_VOTES = {code: vote for vote, code in DISCUSSION_VOTE_CODES.items()}
+
+    VOTE_SEPARATOR = "."
+    DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+    LEGACY_DISCUSSION_VOTE_PREFIX = "discussion-vote-click-"
+    LEGACY_ESTIMATION_VOTE_PREFIX = "estimation-vote-click-"
+    # Legacy operation data is `<operation>-click-<facilitator message id>`
+    LEGACY_OPERATION_PREFIXES = {
+        "start_estimation-click-": "start_estimation",
+        "end_estimation-click-": "end_estimation",
+        "clear_votes-click-": "clear_votes",
+        "re_estimate-click-": "re_estimate",
+    }
+    LEGACY_PREFIXES = (LEGACY_DISCUSSION_VOTE_PREFIX, LEGACY_ESTIMATION_VOTE_PREFIX, *LEGACY_OPERATION_PREFIXES)
+
+    def __init__(self, action: str, facilitator_message_id: int, vote: str = ""):
+        self.action = action
+        self.facilitator_message_id = facilitator_message_id
+        self.vote = vote
+
+    def encode(self) -> str:
+        """
+        Compact form is one action code character, base36 facilitator message id
+        and optional vote code, e.g. `d2bi.e` instead of `discussion-vote-click-3006-to_estimate`.
+        """
+        result = self.ACTION_CODES[self.action] + self.encode_number(int(self.facilitator_message_id))
+
+        if self.action == self.ACTION_DISCUSSION_VOTE:
+            result += self.VOTE_SEPARATOR + self.DISCUSSION_VOTE_CODES[self.vote]
+        elif self.action == self.ACTION_ESTIMATION_VOTE:
+            result += self.VOTE_SEPARATOR + self.vote
+
+        return result
+
+    @classmethod
+    def decode(cls, data: str):
+        if data.startswith(cls.LEGACY_PREFIXES):
+            return cls.decode_legacy(data)
+
+        action = cls.ACTIONS.get(data[:1])
+        if action is None:
+            return None
+
+        facilitator_message_id, _, vote = data[1:].partition(cls.VOTE_SEPARATOR)
+
+        if action == cls.ACTION_DISCUSSION_VOTE:
+            vote = cls.DISCUSSION_VOTES.get(vote)
+
+        if not cls.is_valid_vote(action, vote):
+            return None
+
+        try:
+            return cls(action, cls.decode_number(facilitator_message_id), vote)
+        except ValueError:
+            return None
+
+    @classmethod
+    def decode_legacy(cls, data: str):
+        """
+        Decode callback data of messages posted before compact encoding was introduced.
+        """
+        if data.startswith(cls.LEGACY_DISCUSSION_VOTE_PREFIX):
+            action = cls.ACTION_DISCUSSION_VOTE
+            facilitator_message_id, _, vote = data[len(cls.LEGACY_DISCUSSION_VOTE_PREFIX):].partition("-")
+        elif data.startswith(cls.LEGACY_ESTIMATION_VOTE_PREFIX):
+            action = cls.ACTION_ESTIMATION_VOTE
+            facilitator_message_id, _, vote = data[len(cls.LEGACY_ESTIMATION_VOTE_PREFIX):].partition("-")
+        else:
+            prefix = next((prefix for prefix in cls.LEGACY_OPERATION_PREFIXES if data.startswith(prefix)), None)
+            if prefix is None:
+                return None
+
+            action = cls.LEGACY_OPERATION_PREFIXES[prefix]
+            facilitator_message_id = data[len(prefix):]
+            vote = ""
+
+        if not cls.is_valid_vote(action, vote) or not (facilitator_message_id.isascii() and facilitator_message_id.isdecimal()):
+            return None
+
+        return cls(action, int(facilitator_message_id), vote)
+
+    @classmethod
+    def is_valid_vote(cls, action: str, vote) -> bool:
+        """
+        Votes are required for vote actions and absent for facilitator operations.
+        """
+        if action == cls.ACTION_DISCUSSION_VOTE:
+            return vote in cls.DISCUSSION_VOTE_CODES
+        if action == cls.ACTION_ESTIMATION_VOTE:
+            return bool(vote)
+
+        return vote == ""
+
+    @classmethod
+    def encode_number(cls, number: int) -> str:
+        if number == 0:
+            return cls.DIGITS[0]
+
+        result = ""
+        while number > 0:
+            number, digit = divmod(number, len(cls.DIGITS))
+            result = cls.DIGITS[digit] + result
+
+        return result
+
+    @classmethod
+    def decode_number(cls, value: str) -> int:
+        # `int` also accepts signs, underscores, spaces and upper case, which `encode_number` never produces
+        if not value or value.strip(cls.DIGITS):
+            raise ValueError("Invalid number {!r}".format(value))
+
+        return int(value, len(cls.DIGITS))
@@ -0,0 +1,193 @@
+from app.bounded_cache import BoundedCache
+from app.callback_data import CallbackData
+
+
+class CardDeck:
+    """
+    Estimation cards of a chat. Every deck is compiled once into a set of valid votes,
+    numeric values of cards used for statistics and keyboard rows cached by game session.
+    """
+
+    NAME_DEFAULT = "default"
+    NAME_FIBONACCI = "fibonacci"
+    NAME_TSHIRT = "tshirt"
+    NAME_POWERS_OF_TWO = "powers"
+    NAME_CUSTOM = "custom"
+
+    CARD_UNSURE = "❓"
+
+    PRESET_CARDS = {
+        NAME_DEFAULT: ["0.5", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "12", "18", "24", "30", "36"],
+        NAME_FIBONACCI: ["0", "1", "2", "3", "5", "8", "13", "21", "34", "55", "89"],
+        NAME_TSHIRT: ["XS", "S", "M", "L", "XL", "XXL"],
+        NAME_POWERS_OF_TWO: ["0", "1", "2", "4", "8", "16", "32", "64"],
+    }
+    NAMES = list(PRESET_CARDS) + [NAME_CUSTOM]
+
+    ROW_LENGTH = 6
+    CUSTOM_CARDS_LIMIT = 24
+    # Cards are sent in callback data, which Telegram limits to 64 bytes
+    CARD_LENGTH_LIMIT = 8
+    KEYBOARD_CACHE_SIZE = 1000
+    COMPILED_DECKS_CACHE_SIZE = 1000
+
+    compiled_decks = BoundedCache(COMPILED_DECKS_CACHE_SIZE)
+
+    def __init__(self, name: str, cards: list):
+        self.name = name
+        self.cards = list(cards) + [self.CARD_UNSURE]
+        self.votes = frozenset(self.cards)
+        self.numeric_values = self.compile_numeric_values(cards)
+        self.is_numeric = all(self.is_number(card) for card in cards)
+        self.ordered_cards = sorted(self.numeric_values, key=self.numeric_values.get)
+        self.layout = [self.cards[index:index + self.ROW_LENGTH] for index in range(0, len(self.cards), self.ROW_LENGTH)]
+        self.keyboard_rows = BoundedCache(self.KEYBOARD_CACHE_SIZE)
+
+    @classmethod
+    def get(cls, name: str = NAME_DEFAULT, cards: list = None):
+        """
+        Compiled deck by name, custom decks are compiled once per distinct list of cards.
+        """
+        if name != cls.NAME_CUSTOM:
+            cards = cls.PRESET_CARDS[name]
+
+        key = (name, tuple(cards))
+        deck = cls.compiled_decks.get(key)
+        if deck is None:
+            deck = cls(name, cards)
+            cls.compiled_decks[key] = deck
+
+        return deck
+
+    @classmethod
+    def parse_custom_cards(cls, text: str) -> list:
+        cards = []
+        for card in text.replace(",", " ").split():
+            if card not in cards and card != cls.CARD_UNSURE:
+                cards.append(card)
+
+        if not cards or len(cards) > cls.CUSTOM_CARDS_LIMIT:
+            raise ValueError("Custom deck needs from 1 to {} cards".format(cls.CUSTOM_CARDS_LIMIT))
+
+        if any(len(card) > cls.CARD_LENGTH_LIMIT for card in cards):
+            raise ValueError("Card can be up to {} characters long".format(cls.CARD_LENGTH_LIMIT))
+
+        return cards
+
+    @classmethod
+    def is_possible_vote(cls, vote: str) -> bool:
+        """
+        Cheap check of vote from callback data before game session and its deck are looked up.
+        """
+        return 0 < len(vote) <= cls.CARD_LENGTH_LIMIT
+
+    def is_valid_vote(self, vote: str) -> bool:
+        return vote in self.votes
+
+    @classmethod
+    def compile_numeric_values(cls, cards: list) -> dict:
+        """
+        Numbers as they are, other cards by their position in the deck.
+        """
+        if all(cls.is_number(card) for card in cards):
+            return {card: float(card) for card in cards}
+
+        return {card: float(index) for index, card in enumerate(cards)}
+
+    @staticmethod
+    def is_number(card: str) -> bool:
+        try:
+            float(card)
+        except ValueError:
+            return False
+
+        return True
+
+    def get_keyboard_rows(self, facilitator_message_id: int) -> list:
+        facilitator_message_id = int(facilitator_message_id)
+        keyboard_rows = self.keyboard_rows.get(facilitator_message_id)
+
+        if keyboard_rows is None:
+            keyboard_rows = [
+                [
+                    {
+                        "type": "InlineKeyboardButton",
+                        "text": card,
+                        "callback_data": CallbackData(CallbackData.ACTION_ESTIMATION_VOTE, facilitator_message_id, card).encode(),
+                    }
+                    for card in layout_row
+                ]
+                for layout_row in self.layout
+            ]
+            self.keyboard_rows[facilitator_message_id] = keyboard_rows
+
+        return keyboard_rows
+
+    def summarize(self, votes) -> dict:
+        """
+        Median and spread of numeric votes, counted in one pass over votes and then over the ordered cards,
+        so votes are never sorted. Returns None when there are no numeric votes.
+        """
+        counts = dict.fromkeys(self.ordered_cards, 0)
+        votes_count = 0
+
+        for vote in votes:
+            if vote in counts:
+                counts[vote] += 1
+                votes_count += 1
+
+        if votes_count == 0:
+            return None
+
+        voted_cards = [card for card, count in counts.items() if count > 0]
+        lower_median_index = (votes_count - 1) // 2
+        upper_median_index = votes_count // 2
+        lower_median_card = None
+        upper_median_card = None
+        position = 0
+
+        for card in voted_cards:
+            position += counts[card]
+            if lower_median_card is None and lower_median_index < position:
+                lower_median_card = card
+            if upper_median_index < position:
+                upper_median_card = card
+                break
+
+        return {
+            "median": (self.numeric_values[lower_median_card] + self.numeric_values[upper_median_card]) / 2,
+            "median_card": lower_median_card,
+            "min_card": voted_cards[0],
+            "max_card": voted_cards[-1],
+            "spread": self.numeric_values[voted_cards[-1]] - self.numeric_values[voted_cards[0]],
+            "votes_count": votes_count,
+        }
+
+    def render_summary_text(self, votes) -> str:
+        summary = self.summarize(votes)
+        if summary is None:
+            return ""
+
+        if self.is_numeric:
+            median = "{:g}".format(summary["median"])
+        else:
+            median = summary["median_card"]
+
+        return "Median: {}, spread: {}–{}".format(median, summary["min_card"], summary["max_card"])
+
+    def to_dict(self):
+        result = {
+            "name": self.name,
+        }
+
+        if self.name == self.NAME_CUSTOM:
+            result["cards"] = self.cards[:-1]
+
+        return result
+
+    @classmethod
+    def from_dict(cls, dict):
+        if dict is None:
+            return cls.get()
+
+        return cls.get(dict["name"], dict.get("cards"))
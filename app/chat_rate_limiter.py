@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+
+class ChatRateLimiter:
+    # Telegram allows bots to send about 20 messages per minute to the same group
+    GROUP_MESSAGES_PER_MINUTE = 20
+
+    def __init__(self, messages_per_minute: int = GROUP_MESSAGES_PER_MINUTE, capacity: int = 1000):
+        self.interval = 60.0 / messages_per_minute
+        self.capacity = capacity
+        self.next_send_at = {}
+        self.evicted_count = 0
+
+    async def wait(self, chat_id: int):
+        now = time.monotonic()
+        send_at = max(now, self.next_send_at.get(chat_id, now))
+        self.next_send_at[chat_id] = send_at + self.interval
+
+        if len(self.next_send_at) > self.capacity:
+            self.evict_expired(now)
+
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+
+    def evict_expired(self, now: float):
+        """
+        Chats which may send right away need no entry,
+        entries of chats still waiting are kept to respect the limit.
+        """
+        expired_chat_ids = [chat_id for chat_id, send_at in self.next_send_at.items() if send_at <= now]
+        for chat_id in expired_chat_ids:
+            del self.next_send_at[chat_id]
+        self.evicted_count += len(expired_chat_ids)
+
+    def get_stats(self) -> dict:
+        return {
+            "chats_count": len(self.next_send_at),
+            "capacity": self.capacity,
+            "evicted_count": self.evicted_count,
+        }
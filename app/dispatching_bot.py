@@ -0,0 +1,133 @@
+from aiotg import Bot, BotApiError
+from aiotg.bot import MESSAGE_UPDATES, RETRY_CODES, RETRY_TIMEOUT
+from app.update_dispatcher import UpdateDispatcher
+import aiohttp
+import aiotg.bot
+import asyncio
+import logbook
+
+
+class DispatchingBot(Bot):
+    """
+    aiotg bot which hands updates over to `UpdateDispatcher`
+    instead of starting an unbounded task per update.
+    Updates dropped by the dispatcher for a flooding chat are acknowledged and logged with their ids.
+    Redelivered updates are skipped with `update_deduplicator` when it is set,
+    Bot API calls go through `http_client` pools when it is set.
+    """
+
+    POLLING_RETRY_TIMEOUT = 1
+
+    def __init__(self, api_token: str, update_dispatcher: UpdateDispatcher, **options):
+        super().__init__(api_token, **options)
+        self.update_dispatcher = update_dispatcher
+        self.update_recorder = None
+        self.update_deduplicator = None
+        self.http_client = None
+
+    async def loop(self):
+        self._running = True
+        while self._running:
+            await self.update_dispatcher.wait_for_capacity()
+            try:
+                updates = await self.api_call(
+                    "getUpdates", offset=self._offset + 1, timeout=self.api_timeout
+                )
+            except (asyncio.TimeoutError, aiohttp.ClientError) as error:
+                logbook.warning("Polling failed: {!r}", error)
+                await asyncio.sleep(self.POLLING_RETRY_TIMEOUT)
+                continue
+            self._process_updates(updates)
+
+    async def _api_call(self, method, **params):
+        if self.http_client is None:
+            return await super()._api_call(method, **params)
+
+        url = "{0}/bot{1}/{2}".format(aiotg.bot.API_URL, self.api_token, method)
+        response = await self.http_client.post(
+            method, url, params, self.json_serialize, proxy=self.proxy, proxy_auth=self.proxy_auth
+        )
+
+        if response.status == 200:
+            return await response.json(loads=self.json_deserialize)
+
+        if response.status in RETRY_CODES:
+            logbook.info("Server returned {}, retrying in {} sec.", response.status, RETRY_TIMEOUT)
+            await asyncio.sleep(RETRY_TIMEOUT)
+            return await self.api_call(method, **params)
+
+        if response.content_type == "application/json":
+            error_message = (await response.json(loads=self.json_deserialize))["description"]
+        else:
+            error_message = await response.read()
+        logbook.error(error_message)
+        raise BotApiError(error_message, response=response)
+
+    async def close(self):
+        if self.update_recorder is not None:
+            self.update_recorder.close()
+        if self.http_client is not None:
+            await self.http_client.close()
+        if self._session is not None:
+            await self._session.close()
+
+    def _process_update(self, update):
+        update_id = update["update_id"]
+
+        if self.update_recorder is not None:
+            self.update_recorder.record(update)
+
+        self._offset = max(self._offset, update_id)
+
+        if self.update_deduplicator is not None and self.update_deduplicator.is_duplicate(update):
+            logbook.info("Duplicate update {} skipped", update_id)
+            return
+
+        coro = None
+
+        for update_type in MESSAGE_UPDATES:
+            if update_type in update:
+                coro = self._process_message(update[update_type])
+                break
+        else:
+            if "inline_query" in update:
+                coro = self._process_inline_query(update["inline_query"])
+            elif "callback_query" in update:
+                coro = self._process_callback_query(update["callback_query"])
+            elif "pre_checkout_query" in update:
+                coro = self._process_pre_checkout_query(update["pre_checkout_query"])
+            else:
+                logbook.error("Don't know how to handle update: {}", update)
+
+        if coro is None:
+            return
+
+        chat_id = self.get_update_chat_id(update)
+
+        if self.update_deduplicator is None:
+            if not self.update_dispatcher.submit(chat_id, coro):
+                logbook.warning("Update {} dropped, queue of chat {} is full", update_id, chat_id)
+            return
+
+        self.update_deduplicator.start(update_id)
+        if not self.update_dispatcher.submit(chat_id, self.track_update(update_id, coro)):
+            coro.close()
+            self.update_deduplicator.finish(update_id)
+            logbook.warning("Update {} dropped, queue of chat {} is full", update_id, chat_id)
+
+    async def track_update(self, update_id: int, coro):
+        try:
+            await coro
+        finally:
+            self.update_deduplicator.finish(update_id)
+
+    @staticmethod
+    def get_update_chat_id(update: dict):
+        for update_type in MESSAGE_UPDATES:
+            if update_type in update:
+                return update[update_type].get("chat", {}).get("id")
+
+        if "callback_query" in update and "message" in update["callback_query"]:
+            return update["callback_query"]["message"]["chat"]["id"]
+
+        return None
@@ -0,0 +1,45 @@
+"""
+Export games, game sessions or individual votes history.
+
+Usage:
+    python -m app.export devpoker_bot.db votes --format csv --chat-id -100123 --since 2024-01-01 > votes.csv
+"""
+import aiosqlite
+import argparse
+import asyncio
+import sys
+from app.history_exporter import HistoryExporter
+
+
+async def export(arguments):
+    async with aiosqlite.connect(arguments.db_path) as db_connection:
+        db_connection.row_factory = aiosqlite.Row
+        history_exporter = HistoryExporter(db_connection)
+
+        lines = history_exporter.iterate_lines(
+            arguments.kind,
+            arguments.format,
+            arguments.chat_id,
+            arguments.since,
+            arguments.until,
+        )
+        async for line in lines:
+            sys.stdout.write(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export DevPoker bot history")
+    parser.add_argument("db_path", help="path to the bot SQLite database")
+    parser.add_argument("kind", choices=HistoryExporter.KINDS)
+    parser.add_argument("--format", choices=HistoryExporter.FORMATS, default=HistoryExporter.FORMAT_CSV)
+    parser.add_argument("--chat-id", type=int)
+    parser.add_argument("--since", type=HistoryExporter.parse_date, help="YYYY-MM-DD, inclusive")
+    parser.add_argument("--until", type=HistoryExporter.parse_date, help="YYYY-MM-DD, exclusive")
+    arguments = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(export(arguments))
+
+
+if __name__ == "__main__":
+    main()
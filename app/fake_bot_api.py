@@ -0,0 +1,82 @@
+from aiohttp import web
+import asyncio
+import collections
+
+
+class FakeBotApi:
+    """
+    Local stand-in for Telegram Bot API, used by replay and benchmark tools.
+    Sent messages get sequential ids per chat, updates pushed with `push_updates`
+    are served to `getUpdates` long polling.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.updates = []
+        self.has_updates = asyncio.Event()
+        self.message_ids = collections.defaultdict(int)
+        self.calls_count = collections.Counter()
+        self.runner = None
+
+    @property
+    def url(self) -> str:
+        return "http://{}:{}".format(self.host, self.port)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("POST", "/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        # Release pending long polling requests, otherwise cleanup waits for their timeout
+        self.has_updates.set()
+        await self.runner.cleanup()
+
+    def push_updates(self, updates: list):
+        self.updates.extend(updates)
+        self.has_updates.set()
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = await request.post()
+        self.calls_count[method] += 1
+
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self.get_updates(params)})
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            self.message_ids[chat_id] += 1
+            return web.json_response({
+                "ok": True,
+                "result": {
+                    "message_id": self.message_ids[chat_id],
+                    "chat": {"id": chat_id},
+                    "text": params.get("text"),
+                },
+            })
+
+        return web.json_response({"ok": True, "result": True})
+
+    async def get_updates(self, params) -> list:
+        offset = int(params.get("offset", 0))
+        timeout = float(params.get("timeout", 0))
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+
+        if not self.updates and timeout > 0:
+            self.has_updates.clear()
+            try:
+                await asyncio.wait_for(self.has_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        return self.updates[:100]
@@ -14,6 +14,9 @@ class Game:
         self.name = name
         self.facilitator = facilitator
 
+    def start(self):
+        self.status = self.STATUS_STARTED
+
     def end(self):
         self.status = self.STATUS_ENDED
 
@@ -1,19 +1,62 @@
 from app.game import Game
 from app.game_session import GameSession
 from app.telegram_user import TelegramUser
-import aiosqlite
+from app.bounded_cache import BoundedCache
+from app.card_deck import CardDeck
+import asyncio
+import contextlib
 import json
+import weakref
 
 
 class GameRegistry:
-    def __init__(self):
+    INSERT_GAME_SESSION_QUERY = """
+        INSERT INTO game_session
+        (
+            game_id,
+            chat_id,
+            facilitator_id,
+            facilitator_message_id,
+            system_message_id,
+            phase,
+            topic,
+            json_data,
+            created_at,
+            updated_at
+        ) VALUES (
+            :game_id,
+            :chat_id,
+            :facilitator_id,
+            :facilitator_message_id,
+            :system_message_id,
+            :phase,
+            :topic,
+            :json_data,
+            datetime('now'),
+            datetime('now')
+        )
+    """
+
+    def __init__(self, active_games_capacity: int = 10000, game_sessions_capacity: int = 10000):
         self.db_connection = None
+        # Writes share one connection, a rollback must not discard statements of another operation
+        self.write_lock = asyncio.Lock()
+        # Identity map of games referenced by cached active games and game sessions,
+        # so a game loaded again after eviction is the same object the cached game sessions see
+        self.games = weakref.WeakValueDictionary()
+        self.active_games = BoundedCache(active_games_capacity)
+        self.game_sessions = BoundedCache(game_sessions_capacity)
+        self.chat_card_decks = BoundedCache(active_games_capacity)
 
     async def init_db(self, db_path: str):
+        import aiosqlite
+
         db_connection = aiosqlite.connect(db_path)
         db_connection.daemon = True
         self.db_connection = await db_connection
         self.db_connection.row_factory = aiosqlite.Row
+        # Readers, e.g. history export, do not block writes of the bot in WAL mode
+        await self.db_connection.execute("PRAGMA journal_mode=WAL")
         await self.run_migrations()
 
     async def run_migrations(self):
@@ -57,63 +100,118 @@ class GameRegistry:
                 ON game_session (chat_id, system_message_id);
             """
         )
+        # Partial indexes of live rows, so preload does not grow with resolved history
+        await self.db_connection.execute(
+            """
+                CREATE INDEX IF NOT EXISTS game_session_live_idx
+                ON game_session (system_message_id) WHERE phase != 'resolution';
+            """
+        )
+        await self.db_connection.execute(
+            """
+                CREATE INDEX IF NOT EXISTS game_active_idx
+                ON game (chat_id, facilitator_id, system_message_id) WHERE status = 'started';
+            """
+        )
 
-    async def create_game(self, game: Game):
         await self.db_connection.execute(
             """
-                INSERT INTO game
-                (
-                    chat_id,
-                    facilitator_id,
-                    facilitator_message_id,
-                    system_message_id,
-                    status,
-                    name,
-                    json_data,
-                    created_at,
-                    updated_at
-                ) VALUES (
-                    :chat_id,
-                    :facilitator_id,
-                    :facilitator_message_id,
-                    :system_message_id,
-                    :status,
-                    :name,
-                    :json_data,
-                    datetime('now'),
-                    datetime('now')
+                CREATE TABLE IF NOT EXISTS chat_card_deck (
+                    chat_id INTEGER PRIMARY KEY,
+                    json_data TEXT NOT NULL,
+                    updated_at DATETIME NOT NULL
                 )
-            """,
-            {
-                "chat_id": game.chat_id,
-                "facilitator_id": game.facilitator.id,
-                "facilitator_message_id": game.facilitator_message_id,
-                "system_message_id": game.system_message_id,
-                "status": game.status,
-                "name": game.name,
-                "json_data": json.dumps(game.to_dict()),
-            }
+            """
         )
-        await self.db_connection.commit()
 
-    async def update_game(self, game: Game):
         await self.db_connection.execute(
             """
-                UPDATE game
-                SET status = :game_status
-                WHERE id = :game_id
-            """,
-            {
-                "game_id": game.id,
-                "game_status": game.status,
-            }
+                CREATE TABLE IF NOT EXISTS bot_state (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL,
+                    updated_at DATETIME NOT NULL
+                )
+            """
         )
-        await self.db_connection.commit()
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """
+        Statements executed within the block are committed together or rolled back on error.
+        """
+        async with self.write_lock:
+            try:
+                yield self.db_connection
+            except BaseException:
+                await self.db_connection.rollback()
+                raise
+
+            await self.db_connection.commit()
+
+    async def create_game(self, game: Game):
+        async with self.transaction():
+            cursor = await self.db_connection.execute(
+                """
+                    INSERT INTO game
+                    (
+                        chat_id,
+                        facilitator_id,
+                        facilitator_message_id,
+                        system_message_id,
+                        status,
+                        name,
+                        json_data,
+                        created_at,
+                        updated_at
+                    ) VALUES (
+                        :chat_id,
+                        :facilitator_id,
+                        :facilitator_message_id,
+                        :system_message_id,
+                        :status,
+                        :name,
+                        :json_data,
+                        datetime('now'),
+                        datetime('now')
+                    )
+                """,
+                {
+                    "chat_id": game.chat_id,
+                    "facilitator_id": game.facilitator.id,
+                    "facilitator_message_id": game.facilitator_message_id,
+                    "system_message_id": game.system_message_id,
+                    "status": game.status,
+                    "name": game.name,
+                    "json_data": json.dumps(game.to_dict()),
+                }
+            )
+        game.id = cursor.lastrowid
+        self.remember_game(game)
+
+    async def update_game(self, game: Game):
+        async with self.transaction():
+            await self.db_connection.execute(
+                """
+                    UPDATE game
+                    SET status = :game_status
+                    WHERE id = :game_id
+                """,
+                {
+                    "game_id": game.id,
+                    "game_status": game.status,
+                }
+            )
+        self.remember_game(game)
 
     async def find_active_game(self, chat_id: int, facilitator: TelegramUser) -> Game:
+        game = self.active_games.get((chat_id, facilitator.id))
+        if game is not None:
+            return game
+
         query = """
             SELECT
                 id AS game_id,
+                chat_id AS game_chat_id,
                 facilitator_message_id AS game_facilitator_message_id,
                 system_message_id AS game_system_message_id,
                 status AS game_status,
@@ -137,30 +235,23 @@ class GameRegistry:
             if not row:
                 return None
 
-            game_json_data = json.loads(row["game_json_data"])
-            game_facilitator = TelegramUser.from_dict(game_json_data["facilitator"])
-
-            game = Game.from_dict(
-                chat_id,
-                row["game_facilitator_message_id"],
-                row["game_name"],
-                game_facilitator,
-            )
-            game.id = row["game_id"]
-            game.system_message_id = row["game_system_message_id"]
-            game.status = row["game_status"]
-
-            return game
+            return self.game_from_row(row)
 
     async def find_active_game_session(self, chat_id: int, game_session_facilitator_message_id: int) -> GameSession:
+        game_session = self.game_sessions.get((chat_id, game_session_facilitator_message_id))
+        if game_session is not None:
+            return game_session
+
         query = """
             SELECT
                 g.id AS game_id,
+                g.chat_id AS game_chat_id,
                 g.facilitator_message_id AS game_facilitator_message_id,
                 g.system_message_id AS game_system_message_id,
                 g.status AS game_status,
                 g.name AS game_name,
                 g.json_data AS game_json_data,
+                gs.chat_id AS game_session_chat_id,
                 gs.facilitator_message_id AS game_session_facilitator_message_id,
                 gs.system_message_id AS game_session_system_message_id,
                 gs.phase AS game_session_phase,
@@ -184,97 +275,182 @@ class GameRegistry:
             if not row:
                 return None
 
-            if row["game_id"] is None:
-                game = None
-            else:
-                game_json_data = json.loads(row["game_json_data"])
-                game_facilitator = TelegramUser.from_dict(game_json_data["facilitator"])
-
-                game = Game.from_dict(
-                    chat_id,
-                    row["game_facilitator_message_id"],
-                    row["game_name"],
-                    game_facilitator,
-                )
-                game.id = row["game_id"]
-                game.system_message_id = row["game_system_message_id"]
-                game.status = row["game_status"]
-
-            game_session_json_data = json.loads(row["game_session_json_data"])
-            game_session_facilitator = TelegramUser.from_dict(game_session_json_data["facilitator"])
-
-            game_session = GameSession.from_dict(
-                game,
-                chat_id,
-                row["game_session_facilitator_message_id"],
-                row["game_session_topic"],
-                game_session_facilitator,
-                game_session_json_data,
-            )
-            game_session.system_message_id = row["game_session_system_message_id"]
-            game_session.phase = row["game_session_phase"]
+            return self.game_session_from_row(row)
 
-            return game_session
+    async def preload(self):
+        """
+        Load all active games and not resolved game sessions into memory with a single query,
+        so the first click on every live game session after restart does not hit the database.
+        """
+        query = """
+            SELECT
+                g.id AS game_id,
+                g.chat_id AS game_chat_id,
+                g.facilitator_message_id AS game_facilitator_message_id,
+                g.system_message_id AS game_system_message_id,
+                g.status AS game_status,
+                g.name AS game_name,
+                g.json_data AS game_json_data,
+                gs.chat_id AS game_session_chat_id,
+                gs.facilitator_message_id AS game_session_facilitator_message_id,
+                gs.system_message_id AS game_session_system_message_id,
+                gs.phase AS game_session_phase,
+                gs.topic AS game_session_topic,
+                gs.json_data AS game_session_json_data
+            FROM game_session AS gs
+            LEFT JOIN game AS g
+            ON gs.game_id = g.id
+            WHERE gs.phase != :resolution_game_session_phase
+            AND (g.id IS NULL OR g.status = :active_game_status)
+            UNION ALL
+            SELECT
+                g.id AS game_id,
+                g.chat_id AS game_chat_id,
+                g.facilitator_message_id AS game_facilitator_message_id,
+                g.system_message_id AS game_system_message_id,
+                g.status AS game_status,
+                g.name AS game_name,
+                g.json_data AS game_json_data,
+                NULL AS game_session_chat_id,
+                NULL AS game_session_facilitator_message_id,
+                NULL AS game_session_system_message_id,
+                NULL AS game_session_phase,
+                NULL AS game_session_topic,
+                NULL AS game_session_json_data
+            FROM game AS g
+            WHERE g.status = :active_game_status
+            ORDER BY game_session_system_message_id ASC
+        """
+        parameters = {
+            "resolution_game_session_phase": GameSession.PHASE_RESOLUTION,
+            "active_game_status": Game.STATUS_STARTED,
+        }
+        async with self.db_connection.execute(query, parameters) as cursor:
+            async for row in cursor:
+                if row["game_session_system_message_id"] is None:
+                    self.game_from_row(row)
+                else:
+                    self.game_session_from_row(row)
 
-    async def create_game_session(self, game_session: GameSession):
-        await self.db_connection.execute(
-            """
-                INSERT INTO game_session
-                (
-                    game_id,
-                    chat_id,
-                    facilitator_id,
-                    facilitator_message_id,
-                    system_message_id,
-                    phase,
-                    topic,
-                    json_data,
-                    created_at,
-                    updated_at
-                ) VALUES (
-                    :game_id,
-                    :chat_id,
-                    :facilitator_id,
-                    :facilitator_message_id,
-                    :system_message_id,
-                    :phase,
-                    :topic,
-                    :json_data,
-                    datetime('now'),
-                    datetime('now')
-                )
-            """,
-            {
-                "game_id": game_session.game_id,
-                "chat_id": game_session.chat_id,
-                "facilitator_id": game_session.facilitator.id,
-                "facilitator_message_id": game_session.facilitator_message_id,
-                "system_message_id": game_session.system_message_id,
-                "phase": game_session.phase,
-                "topic": game_session.topic,
-                "json_data": json.dumps(game_session.to_dict()),
-            }
+    def game_from_row(self, row) -> Game:
+        game = self.games.get(row["game_id"])
+        if game is not None:
+            return game
+
+        game_json_data = json.loads(row["game_json_data"])
+        game_facilitator = TelegramUser.from_dict(game_json_data["facilitator"])
+
+        game = Game.from_dict(
+            row["game_chat_id"],
+            row["game_facilitator_message_id"],
+            row["game_name"],
+            game_facilitator,
         )
-        await self.db_connection.commit()
+        game.id = row["game_id"]
+        game.system_message_id = row["game_system_message_id"]
+        game.status = row["game_status"]
 
-    async def update_game_session(self, game_session: GameSession):
-        await self.db_connection.execute(
-            """
-                UPDATE game_session
-                SET phase = :phase,
-                    json_data = :json_data,
-                    updated_at = datetime('now')
-                WHERE chat_id = :chat_id
-                AND system_message_id = :system_message_id
-            """,
-            {
-                "phase": game_session.phase,
-                "json_data": json.dumps(game_session.to_dict()),
-                "chat_id": game_session.chat_id,
-                "system_message_id": game_session.system_message_id,
-            }
+        self.remember_game(game)
+
+        return game
+
+    def game_session_from_row(self, row) -> GameSession:
+        if row["game_id"] is None:
+            game = None
+        else:
+            game = self.game_from_row(row)
+
+        game_session_json_data = json.loads(row["game_session_json_data"])
+        game_session_facilitator = TelegramUser.from_dict(game_session_json_data["facilitator"])
+
+        game_session = GameSession.from_dict(
+            game,
+            row["game_session_chat_id"],
+            row["game_session_facilitator_message_id"],
+            row["game_session_topic"],
+            game_session_facilitator,
+            game_session_json_data,
         )
-        await self.db_connection.commit()
+        game_session.system_message_id = row["game_session_system_message_id"]
+        game_session.phase = row["game_session_phase"]
+
+        self.remember_game_session(game_session)
+
+        return game_session
+
+    def remember_game(self, game: Game):
+        if not game.is_active():
+            self.forget_game(game)
+            return
+
+        self.games[game.id] = game
+        self.active_games[(game.chat_id, game.facilitator.id)] = game
+
+    def forget_game(self, game: Game):
+        self.games.pop(game.id, None)
+        if self.active_games.get((game.chat_id, game.facilitator.id)) is game:
+            del self.active_games[(game.chat_id, game.facilitator.id)]
+
+    def remember_game_session(self, game_session: GameSession):
+        self.game_sessions[(game_session.chat_id, int(game_session.facilitator_message_id))] = game_session
+
+    def forget_game_session(self, game_session: GameSession):
+        key = (game_session.chat_id, int(game_session.facilitator_message_id))
+        if self.game_sessions.get(key) is game_session:
+            del self.game_sessions[key]
+
+    def get_cache_stats(self) -> dict:
+        return {
+            "games_count": len(self.games),
+            "active_games_count": len(self.active_games),
+            "active_games_capacity": self.active_games.capacity,
+            "active_games_evicted_count": self.active_games.evicted_count,
+            "game_sessions_count": len(self.game_sessions),
+            "game_sessions_capacity": self.game_sessions.capacity,
+            "game_sessions_evicted_count": self.game_sessions.evicted_count,
+            "chat_card_decks_count": len(self.chat_card_decks),
+            "chat_card_decks_evicted_count": self.chat_card_decks.evicted_count,
+        }
+
+    async def create_game_session(self, game_session: GameSession):
+        async with self.transaction():
+            await self.db_connection.execute(
+                self.INSERT_GAME_SESSION_QUERY,
+                self.game_session_insert_parameters(game_session),
+            )
+        self.remember_game_session(game_session)
+
+    @staticmethod
+    def game_session_insert_parameters(game_session: GameSession):
+        return {
+            "game_id": game_session.game_id,
+            "chat_id": game_session.chat_id,
+            "facilitator_id": game_session.facilitator.id,
+            "facilitator_message_id": game_session.facilitator_message_id,
+            "system_message_id": game_session.system_message_id,
+            "phase": game_session.phase,
+            "topic": game_session.topic,
+            "json_data": json.dumps(game_session.to_dict()),
+        }
+
+    async def update_game_session(self, game_session: GameSession):
+        async with self.transaction():
+            await self.db_connection.execute(
+                """
+                    UPDATE game_session
+                    SET phase = :phase,
+                        json_data = :json_data,
+                        updated_at = datetime('now')
+                    WHERE chat_id = :chat_id
+                    AND system_message_id = :system_message_id
+                """,
+                {
+                    "phase": game_session.phase,
+                    "json_data": json.dumps(game_session.to_dict()),
+                    "chat_id": game_session.chat_id,
+                    "system_message_id": game_session.system_message_id,
+                }
+            )
 
     async def get_game_statistics(self, game: Game):
         query = """
@@ -297,3 +473,86 @@ class GameRegistry:
             return {
                 "estimated_game_sessions_count": row["estimated_game_sessions_count"],
             }
+
+    async def find_chat_card_deck(self, chat_id: int) -> CardDeck:
+        card_deck = self.chat_card_decks.get(chat_id)
+        if card_deck is not None:
+            return card_deck
+
+        query = """
+            SELECT
+                json_data
+            FROM chat_card_deck
+            WHERE chat_id = :chat_id
+        """
+        parameters = {
+            "chat_id": chat_id,
+        }
+        async with self.db_connection.execute(query, parameters) as cursor:
+            row = await cursor.fetchone()
+
+            if not row:
+                card_deck = CardDeck.get()
+            else:
+                card_deck = CardDeck.from_dict(json.loads(row["json_data"]))
+
+        self.chat_card_decks[chat_id] = card_deck
+
+        return card_deck
+
+    async def save_chat_card_deck(self, chat_id: int, card_deck: CardDeck):
+        async with self.transaction():
+            await self.db_connection.execute(
+                """
+                    INSERT OR REPLACE INTO chat_card_deck
+                    (
+                        chat_id,
+                        json_data,
+                        updated_at
+                    ) VALUES (
+                        :chat_id,
+                        :json_data,
+                        datetime('now')
+                    )
+                """,
+                {
+                    "chat_id": chat_id,
+                    "json_data": json.dumps(card_deck.to_dict()),
+                }
+            )
+        self.chat_card_decks[chat_id] = card_deck
+
+    async def get_last_update_id(self) -> int:
+        query = """
+            SELECT
+                value
+            FROM bot_state
+            WHERE name = 'last_update_id'
+        """
+        async with self.db_connection.execute(query) as cursor:
+            row = await cursor.fetchone()
+
+            if not row:
+                return 0
+
+            return row["value"]
+
+    async def save_last_update_id(self, update_id: int):
+        async with self.transaction():
+            await self.db_connection.execute(
+                """
+                    INSERT OR REPLACE INTO bot_state
+                    (
+                        name,
+                        value,
+                        updated_at
+                    ) VALUES (
+                        'last_update_id',
+                        :value,
+                        datetime('now')
+                    )
+                """,
+                {
+                    "value": update_id,
+                }
+            )
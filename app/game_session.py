@@ -1,8 +1,12 @@
+from app.callback_data import CallbackData
+from app.card_deck import CardDeck
 from app.discussion_vote import DiscussionVote
 from app.estimation_vote import EstimationVote
 from app.telegram_user import TelegramUser
 from app.game import Game
+from app.sorted_votes import SortedVotes
 import collections
+import itertools
 import json
 
 
@@ -16,13 +20,12 @@ class GameSession:
     OPERATION_CLEAR_VOTES = "clear_votes"
     OPERATION_RE_ESTIMATE = "re_estimate"
 
-    CARD_DECK_LAYOUT = [
-        ["0.5", "1", "2", "3", "4", "5"],
-        ["6", "7", "8", "9", "10", "12"],
-        ["18", "24", "30", "36", "❓"],
-    ]
+    # Above this number of voters votes are rendered as counts and a truncated voters list
+    COMPACT_VOTES_THRESHOLD = 30
+    COMPACT_VOTERS_LIMIT = 20
+    MESSAGE_TEXT_LIMIT = 4096
 
-    def __init__(self, game: Game, chat_id: int, facilitator_message_id: int, topic: str, facilitator: TelegramUser):
+    def __init__(self, game: Game, chat_id: int, facilitator_message_id: int, topic: str, facilitator: TelegramUser, card_deck: CardDeck = None):
         self.id = None
         self.system_message_id = None
         self.game = game
@@ -31,8 +34,9 @@ class GameSession:
         self.phase = self.PHASE_DISCUSSION
         self.topic = topic
         self.facilitator = facilitator
-        self.estimation_votes = collections.defaultdict(EstimationVote)
-        self.discussion_votes = collections.defaultdict(DiscussionVote)
+        self.estimation_votes = SortedVotes(EstimationVote)
+        self.discussion_votes = SortedVotes(DiscussionVote)
+        self.card_deck = card_deck or CardDeck.get()
 
     @property
     def game_id(self) -> int:
@@ -79,7 +83,31 @@ class GameSession:
         result += "\n"
         result += self.render_votes_text()
 
-        return result
+        summary_text = ""
+        if self.phase == self.PHASE_RESOLUTION:
+            summary_text = self.card_deck.render_summary_text(
+                estimation_vote.vote for estimation_vote in self.estimation_votes.values()
+            )
+            if summary_text:
+                summary_text = "\n\n" + summary_text
+
+        # Votes are truncated in large rooms, the summary is always kept
+        return self.truncate_text(result, self.MESSAGE_TEXT_LIMIT - self.get_text_length(summary_text)) + summary_text
+
+    @staticmethod
+    def get_text_length(text: str) -> int:
+        """
+        Length as Telegram counts it, in UTF-16 code units, emoji and other astral characters take two.
+        """
+        return len(text.encode("utf-16-le")) // 2
+
+    @classmethod
+    def truncate_text(cls, text: str, limit: int) -> str:
+        if cls.get_text_length(text) <= limit:
+            return text
+
+        # Half of a surrogate pair left at the cut is dropped by decoding
+        return text.encode("utf-16-le")[:(limit - 1) * 2].decode("utf-16-le", errors="ignore") + "…"
 
     def render_game_text(self):
         if self.game is None:
@@ -117,7 +145,20 @@ class GameSession:
 
         votes_count = len(self.discussion_votes)
 
-        if votes_count > 0:
+        if votes_count > self.COMPACT_VOTES_THRESHOLD:
+            result += "Votes ({}): ".format(votes_count)
+            result += self.render_vote_counts_text(
+                discussion_vote.icon for discussion_vote in self.discussion_votes.values()
+            )
+            result += "\n"
+            result += self.render_compact_voters_text(
+                (
+                    "{} {}".format(discussion_vote.icon, user_id)
+                    for user_id, discussion_vote in self.discussion_votes.sorted_items()
+                ),
+                votes_count,
+            )
+        elif votes_count > 0:
             result += "Votes ({}):".format(votes_count)
             result += "\n"
             result += "\n".join(
@@ -125,7 +166,7 @@ class GameSession:
                     discussion_vote.icon,
                     user_id,
                 )
-                for user_id, discussion_vote in sorted(self.discussion_votes.items())
+                for user_id, discussion_vote in self.discussion_votes.sorted_items()
             )
 
         return result
@@ -135,7 +176,25 @@ class GameSession:
 
         votes_count = len(self.estimation_votes)
 
-        if votes_count > 0:
+        if votes_count > self.COMPACT_VOTES_THRESHOLD:
+            if self.phase == self.PHASE_RESOLUTION:
+                result += "Votes ({}):".format(votes_count)
+                result += "\n"
+                result += self.render_estimation_votes_breakdown_text()
+            else:
+                result += "Votes ({}): ".format(votes_count)
+                result += self.render_vote_counts_text(
+                    estimation_vote.masked for estimation_vote in self.estimation_votes.values()
+                )
+                result += "\n"
+                result += self.render_compact_voters_text(
+                    (
+                        "{} {}".format(estimation_vote.masked, user_id)
+                        for user_id, estimation_vote in self.estimation_votes.sorted_items()
+                    ),
+                    votes_count,
+                )
+        elif votes_count > 0:
             result += "Votes ({}):".format(votes_count)
             result += "\n"
             result += "\n".join(
@@ -143,11 +202,38 @@ class GameSession:
                     estimation_vote.vote if self.phase == self.PHASE_RESOLUTION else estimation_vote.masked,
                     user_id,
                 )
-                for user_id, estimation_vote in sorted(self.estimation_votes.items())
+                for user_id, estimation_vote in self.estimation_votes.sorted_items()
             )
 
         return result
 
+    def render_estimation_votes_breakdown_text(self):
+        voters_by_vote = collections.OrderedDict()
+        for user_id, estimation_vote in self.estimation_votes.sorted_items():
+            # Only `@username` part of user id to fit all voters into a single message
+            voters_by_vote.setdefault(estimation_vote.vote, []).append(user_id.split(" (", 1)[0])
+
+        return "\n".join(
+            "{} ({}): {}".format(vote, len(voters), ", ".join(voters))
+            for vote, voters in sorted(voters_by_vote.items(), key=lambda item: len(item[1]), reverse=True)
+        )
+
+    @staticmethod
+    def render_vote_counts_text(votes):
+        return "  ".join(
+            "{} {}".format(vote, count)
+            for vote, count in collections.Counter(votes).most_common()
+        )
+
+    def render_compact_voters_text(self, voter_lines, votes_count: int):
+        result = "\n".join(itertools.islice(voter_lines, self.COMPACT_VOTERS_LIMIT))
+
+        if votes_count > self.COMPACT_VOTERS_LIMIT:
+            result += "\n"
+            result += "…and {} more".format(votes_count - self.COMPACT_VOTERS_LIMIT)
+
+        return result
+
     def render_system_message_buttons(self):
         layout_rows = []
 
@@ -194,11 +280,7 @@ class GameSession:
                 ]
             )
         elif self.phase in self.PHASE_ESTIMATION:
-            for votes_layout_row in self.CARD_DECK_LAYOUT:
-                vote_buttons_row = []
-                for vote in votes_layout_row:
-                    vote_buttons_row.append(self.render_estimation_vote_button(vote))
-                layout_rows.append(vote_buttons_row)
+            layout_rows.extend(self.card_deck.get_keyboard_rows(self.facilitator_message_id))
 
             layout_rows.append(
                 [
@@ -222,21 +304,14 @@ class GameSession:
         return {
             "type": "InlineKeyboardButton",
             "text": text,
-            "callback_data": "discussion-vote-click-{}-{}".format(self.facilitator_message_id, vote),
-        }
-
-    def render_estimation_vote_button(self, vote: str):
-        return {
-            "type": "InlineKeyboardButton",
-            "text": vote,
-            "callback_data": "estimation-vote-click-{}-{}".format(self.facilitator_message_id, vote),
+            "callback_data": CallbackData(CallbackData.ACTION_DISCUSSION_VOTE, self.facilitator_message_id, vote).encode(),
         }
 
     def render_operation_button(self, operation: str, text: str):
         return {
             "type": "InlineKeyboardButton",
             "text": text,
-            "callback_data": "{}-click-{}".format(operation, self.facilitator_message_id),
+            "callback_data": CallbackData(operation, self.facilitator_message_id).encode(),
         }
 
     @staticmethod
@@ -257,6 +332,7 @@ class GameSession:
             "facilitator": self.facilitator.to_dict(),
             "discussion_votes": self.votes_to_json(self.discussion_votes),
             "estimation_votes": self.votes_to_json(self.estimation_votes),
+            "card_deck": self.card_deck.to_dict(),
         }
 
     @classmethod
@@ -267,6 +343,7 @@ class GameSession:
             facilitator_message_id,
             topic,
             facilitator,
+            CardDeck.from_dict(dict.get("card_deck")),
         )
 
         for user_id, discussion_vote in dict["discussion_votes"].items():
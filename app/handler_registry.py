@@ -0,0 +1,30 @@
+class HandlerRegistry:
+    """
+    Collects command and callback handlers with aiotg-like decorators,
+    so handlers can be declared at import time and bound to a bot created later.
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.callbacks = []
+
+    def command(self, regexp: str):
+        def decorator(fn):
+            self.commands.append((regexp, fn))
+            return fn
+
+        return decorator
+
+    def callback(self, regexp: str):
+        def decorator(fn):
+            self.callbacks.append((regexp, fn))
+            return fn
+
+        return decorator
+
+    def register(self, bot):
+        for regexp, fn in self.commands:
+            bot.add_command(regexp, fn)
+
+        for regexp, fn in self.callbacks:
+            bot.add_callback(regexp, fn)
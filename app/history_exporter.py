@@ -0,0 +1,176 @@
+import csv
+import datetime
+import io
+import json
+
+
+class HistoryExporter:
+    """
+    Streams games, game sessions or individual votes as CSV or JSONL lines.
+    Rows are read in pages ordered by id and turned into lines one by one,
+    so memory usage does not depend on the history size
+    and no statement stays open while lines are consumed, e.g. sent to the chat.
+    """
+
+    PAGE_SIZE = 500
+
+    KIND_GAMES = "games"
+    KIND_GAME_SESSIONS = "sessions"
+    KIND_VOTES = "votes"
+    KINDS = [KIND_GAMES, KIND_GAME_SESSIONS, KIND_VOTES]
+
+    FORMAT_CSV = "csv"
+    FORMAT_JSONL = "jsonl"
+    FORMATS = [FORMAT_CSV, FORMAT_JSONL]
+
+    FIELDS = {
+        KIND_GAMES: [
+            "game_id",
+            "chat_id",
+            "facilitator_id",
+            "name",
+            "status",
+            "created_at",
+            "updated_at",
+        ],
+        KIND_GAME_SESSIONS: [
+            "game_session_id",
+            "game_id",
+            "chat_id",
+            "facilitator_id",
+            "facilitator_message_id",
+            "system_message_id",
+            "phase",
+            "topic",
+            "created_at",
+            "updated_at",
+        ],
+        KIND_VOTES: [
+            "game_session_id",
+            "game_id",
+            "chat_id",
+            "topic",
+            "phase",
+            "vote_type",
+            "user",
+            "vote",
+            "created_at",
+        ],
+    }
+
+    def __init__(self, db_connection):
+        self.db_connection = db_connection
+
+    async def iterate_lines(self, kind: str, output_format: str, chat_id: int = None, since: str = None, until: str = None):
+        rows = self.iterate_rows(kind, chat_id, since, until)
+
+        if output_format == self.FORMAT_JSONL:
+            async for row in rows:
+                yield json.dumps(row, ensure_ascii=False) + "\n"
+            return
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.FIELDS[kind])
+        writer.writeheader()
+        yield self.take_buffer(buffer)
+
+        async for row in rows:
+            writer.writerow(row)
+            yield self.take_buffer(buffer)
+
+    async def iterate_rows(self, kind: str, chat_id: int = None, since: str = None, until: str = None):
+        if kind == self.KIND_GAMES:
+            query = """
+                SELECT
+                    id AS game_id,
+                    chat_id,
+                    facilitator_id,
+                    name,
+                    status,
+                    created_at,
+                    updated_at
+                FROM game
+            """
+        else:
+            query = """
+                SELECT
+                    id AS game_session_id,
+                    game_id,
+                    chat_id,
+                    facilitator_id,
+                    facilitator_message_id,
+                    system_message_id,
+                    phase,
+                    topic,
+                    json_data,
+                    created_at,
+                    updated_at
+                FROM game_session
+            """
+
+        conditions = []
+        parameters = {}
+
+        if chat_id is not None:
+            conditions.append("chat_id = :chat_id")
+            parameters["chat_id"] = chat_id
+
+        if since is not None:
+            conditions.append("created_at >= :since")
+            parameters["since"] = since
+
+        if until is not None:
+            conditions.append("created_at < :until")
+            parameters["until"] = until
+
+        conditions.append("id > :last_id")
+        query += " WHERE " + " AND ".join(conditions) + " ORDER BY id LIMIT :page_size"
+        parameters["last_id"] = 0
+        parameters["page_size"] = self.PAGE_SIZE
+        id_field = "game_id" if kind == self.KIND_GAMES else "game_session_id"
+
+        while True:
+            async with self.db_connection.execute(query, parameters) as cursor:
+                rows = await cursor.fetchall()
+
+            for row in rows:
+                if kind == self.KIND_VOTES:
+                    for vote_row in self.expand_votes(row):
+                        yield vote_row
+                else:
+                    yield {field: row[field] for field in self.FIELDS[kind]}
+
+            if len(rows) < self.PAGE_SIZE:
+                return
+
+            parameters["last_id"] = rows[-1][id_field]
+
+    @staticmethod
+    def expand_votes(row):
+        json_data = json.loads(row["json_data"])
+
+        for vote_type in ["discussion", "estimation"]:
+            for user, vote in json_data.get(vote_type + "_votes", {}).items():
+                yield {
+                    "game_session_id": row["game_session_id"],
+                    "game_id": row["game_id"],
+                    "chat_id": row["chat_id"],
+                    "topic": row["topic"],
+                    "phase": row["phase"],
+                    "vote_type": vote_type,
+                    "user": user,
+                    "vote": vote["vote"],
+                    "created_at": row["created_at"],
+                }
+
+    @staticmethod
+    def parse_date(value: str) -> str:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+
+    @staticmethod
+    def take_buffer(buffer: io.StringIO) -> str:
+        result = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+        return result
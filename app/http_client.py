@@ -0,0 +1,145 @@
+import aiohttp
+import asyncio
+import time
+
+
+class HttpPool:
+    """
+    aiohttp session over its own connector, with utilisation counters.
+    """
+
+    def __init__(self, name: str, limit: int, keepalive_timeout: float, dns_cache_ttl: int):
+        self.name = name
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.session = None
+        self.in_flight_count = 0
+        self.max_in_flight_count = 0
+        self.requests_count = 0
+        self.timeouts_count = 0
+        self.created_connections_count = 0
+        self.reused_connections_count = 0
+        self.queued_count = 0
+        self.queued_time_total = 0.0
+        self.queued_time_max = 0.0
+
+    def get_session(self, json_serialize) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_queued_start.append(self.on_connection_queued_start)
+            trace_config.on_connection_queued_end.append(self.on_connection_queued_end)
+            trace_config.on_connection_create_end.append(self.on_connection_create_end)
+            trace_config.on_connection_reuseconn.append(self.on_connection_reuseconn)
+
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                json_serialize=json_serialize,
+                trace_configs=[trace_config],
+            )
+
+        return self.session
+
+    async def on_connection_queued_start(self, session, context, params):
+        context.queued_at = time.monotonic()
+
+    async def on_connection_queued_end(self, session, context, params):
+        queued_time = time.monotonic() - context.queued_at
+        self.queued_count += 1
+        self.queued_time_total += queued_time
+        self.queued_time_max = max(self.queued_time_max, queued_time)
+
+    async def on_connection_create_end(self, session, context, params):
+        self.created_connections_count += 1
+
+    async def on_connection_reuseconn(self, session, context, params):
+        self.reused_connections_count += 1
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "pool": self.name,
+            "limit": self.limit,
+            "in_flight_count": self.in_flight_count,
+            "max_in_flight_count": self.max_in_flight_count,
+            "utilisation": self.in_flight_count / self.limit,
+            "requests_count": self.requests_count,
+            "timeouts_count": self.timeouts_count,
+            "created_connections_count": self.created_connections_count,
+            "reused_connections_count": self.reused_connections_count,
+            "queued_count": self.queued_count,
+            "average_queued_time": self.queued_time_total / self.queued_count if self.queued_count else 0.0,
+            "max_queued_time": self.queued_time_max,
+        }
+
+
+class HttpClient:
+    """
+    Bot API HTTP client with separate connection pools:
+    `getUpdates` long polling never waits for a free connection behind outgoing calls and vice versa.
+    Connections are kept alive between calls, DNS lookups are cached.
+    """
+
+    POLLING_METHODS = {"getUpdates"}
+    # Long polling request is held by Telegram for `timeout` seconds before the response
+    POLLING_TIMEOUT_MARGIN = 10
+    DEFAULT_TIMEOUT = 15
+    METHOD_TIMEOUTS = {
+        "answerCallbackQuery": 5,
+        "editMessageText": 10,
+        "sendMessage": 10,
+        "sendDocument": 120,
+    }
+
+    def __init__(self, pool_size: int = 32, keepalive_timeout: float = 60, dns_cache_ttl: int = 300):
+        self.polling_pool = HttpPool("polling", 1, keepalive_timeout, dns_cache_ttl)
+        self.outgoing_pool = HttpPool("outgoing", pool_size, keepalive_timeout, dns_cache_ttl)
+
+    def get_pool(self, method: str) -> HttpPool:
+        if method in self.POLLING_METHODS:
+            return self.polling_pool
+
+        return self.outgoing_pool
+
+    def get_timeout(self, method: str, params: dict) -> float:
+        if method in self.POLLING_METHODS:
+            return float(params.get("timeout", 0)) + self.POLLING_TIMEOUT_MARGIN
+
+        return self.METHOD_TIMEOUTS.get(method, self.DEFAULT_TIMEOUT)
+
+    async def post(self, method: str, url: str, params: dict, json_serialize, **options):
+        """
+        Send the request and read the whole response body within the method timeout.
+        Returns the response, its body is available with `read` and `json` after the connection is released.
+        """
+        pool = self.get_pool(method)
+        session = pool.get_session(json_serialize)
+        timeout = aiohttp.ClientTimeout(total=self.get_timeout(method, params))
+
+        pool.requests_count += 1
+        pool.in_flight_count += 1
+        pool.max_in_flight_count = max(pool.max_in_flight_count, pool.in_flight_count)
+        try:
+            async with session.post(url, data=params, timeout=timeout, **options) as response:
+                await response.read()
+                return response
+        except asyncio.TimeoutError:
+            pool.timeouts_count += 1
+            raise
+        finally:
+            pool.in_flight_count -= 1
+
+    async def close(self):
+        await self.polling_pool.close()
+        await self.outgoing_pool.close()
+
+    def get_stats(self) -> list:
+        return [self.polling_pool.get_stats(), self.outgoing_pool.get_stats()]
@@ -0,0 +1,68 @@
+import collections
+import gc
+import resource
+import tracemalloc
+
+
+class MemoryInspector:
+    """
+    Memory usage of the running process: RSS, live objects by type
+    and top allocations traced with `tracemalloc` since the baseline snapshot.
+    Tracing slows allocations down, so it runs only between `start_tracing` and `stop_tracing`.
+    """
+
+    TRACEMALLOC_FRAMES = 5
+
+    def __init__(self):
+        self.baseline_snapshot = None
+
+    @staticmethod
+    def get_rss() -> int:
+        """
+        Current resident set size in bytes, peak RSS where /proc is not available.
+        """
+        try:
+            with open("/proc/self/status") as file:
+                for line in file:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    @staticmethod
+    def count_objects() -> collections.Counter:
+        """
+        Objects tracked by the garbage collector by type name, walks the whole heap.
+        """
+        return collections.Counter(type(item).__name__ for item in gc.get_objects())
+
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start_tracing(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.TRACEMALLOC_FRAMES)
+        self.baseline_snapshot = self.take_snapshot()
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        self.baseline_snapshot = None
+
+    def get_top_allocations(self, limit: int) -> list:
+        """
+        Allocation sites which grew most since the baseline snapshot.
+        """
+        if self.baseline_snapshot is None:
+            return []
+
+        statistics = self.take_snapshot().compare_to(self.baseline_snapshot, "lineno")
+
+        return statistics[:limit]
+
+    @staticmethod
+    def take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
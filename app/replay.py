@@ -0,0 +1,165 @@
+"""
+Replay recorded updates against the real handlers, a fake Bot API and a scratch database.
+
+Usage:
+    python -m app.replay updates.jsonl.gz --speed 10 --state-output state.json
+    python -m app.replay updates.jsonl.gz --speed 0 --compare state.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+async def replay(arguments) -> int:
+    from app.fake_bot_api import FakeBotApi
+
+    fake_bot_api = FakeBotApi()
+    await fake_bot_api.start()
+
+    db_file = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    db_file.close()
+
+    os.environ.setdefault("DEVPOKER_BOT_API_TOKEN", "replay")
+    os.environ["DEVPOKER_BOT_DB_PATH"] = db_file.name
+    os.environ.pop("DEVPOKER_BOT_RECORD_PATH", None)
+
+    import aiotg.bot
+    aiotg.bot.API_URL = fake_bot_api.url
+
+    from app import bot as devpoker_bot
+    devpoker_bot.create_app()
+    from app.update_recorder import UpdateRecorder
+
+    await devpoker_bot.game_registry.init_db(db_file.name)
+
+    latencies = []
+    update_dispatcher = devpoker_bot.update_dispatcher
+    update_dispatcher.latency_observer = latencies.append
+
+    started_at = time.monotonic()
+    first_recorded_at = None
+    updates_count = 0
+
+    for record in UpdateRecorder.read(arguments.path):
+        if first_recorded_at is None:
+            first_recorded_at = record["time"]
+
+        if arguments.speed > 0:
+            delay = (record["time"] - first_recorded_at) / arguments.speed - (time.monotonic() - started_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        await update_dispatcher.wait_for_capacity()
+        devpoker_bot.bot._process_update(record["update"])
+        updates_count += 1
+
+    while not update_dispatcher.is_idle():
+        await asyncio.sleep(0.01)
+
+    elapsed = time.monotonic() - started_at
+    state = await fetch_state(devpoker_bot.game_registry)
+
+    await devpoker_bot.bot.close()
+    await fake_bot_api.stop()
+    os.unlink(db_file.name)
+
+    report = {
+        "updates_count": updates_count,
+        "dropped_count": update_dispatcher.dropped_count,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(updates_count / elapsed, 1) if elapsed else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p99": percentile(latencies, 99),
+        "latency_max": max(latencies, default=None),
+        "bot_api_calls": dict(fake_bot_api.calls_count),
+    }
+    print(json.dumps(report, indent=2))
+
+    if arguments.state_output:
+        with open(arguments.state_output, "w") as file:
+            json.dump(state, file, indent=2, ensure_ascii=False)
+
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            differences = diff_states(json.load(file), state)
+        for difference in differences:
+            print(difference)
+        print("{} game session states differ".format(len(differences)))
+
+        return 1 if differences else 0
+
+    return 0
+
+
+async def fetch_state(game_registry) -> dict:
+    query = """
+        SELECT
+            gs.chat_id,
+            gs.facilitator_message_id,
+            gs.system_message_id,
+            gs.phase,
+            gs.topic,
+            gs.json_data,
+            g.status AS game_status
+        FROM game_session AS gs
+        LEFT JOIN game AS g
+        ON gs.game_id = g.id
+        ORDER BY gs.chat_id, gs.system_message_id
+    """
+    result = {}
+    async with game_registry.db_connection.execute(query) as cursor:
+        async for row in cursor:
+            key = "{}:{}".format(row["chat_id"], row["system_message_id"])
+            result[key] = {
+                "facilitator_message_id": row["facilitator_message_id"],
+                "phase": row["phase"],
+                "topic": row["topic"],
+                "game_status": row["game_status"],
+                "data": json.loads(row["json_data"]),
+            }
+
+    return result
+
+
+def diff_states(expected: dict, actual: dict) -> list:
+    result = []
+
+    for key in sorted(set(expected) | set(actual)):
+        if key not in actual:
+            result.append("- {} missing".format(key))
+        elif key not in expected:
+            result.append("+ {} unexpected".format(key))
+        elif expected[key] != actual[key]:
+            result.append("~ {}: {} != {}".format(key, json.dumps(expected[key]), json.dumps(actual[key])))
+
+    return result
+
+
+def percentile(values: list, percent: int):
+    if not values:
+        return None
+
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+
+    return round(values[index], 6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded updates against the bot handlers")
+    parser.add_argument("path", help="gzip compressed JSONL file written by DEVPOKER_BOT_RECORD_PATH")
+    parser.add_argument("--speed", type=float, default=1, help="replay speed factor, 0 is as fast as possible")
+    parser.add_argument("--state-output", help="write final game session states to this JSON file")
+    parser.add_argument("--compare", help="diff final game session states with this JSON file")
+    arguments = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    sys.exit(loop.run_until_complete(replay(arguments)))
+
+
+if __name__ == "__main__":
+    main()
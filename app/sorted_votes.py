@@ -0,0 +1,29 @@
+import bisect
+import collections
+
+
+class SortedVotes(collections.defaultdict):
+    """
+    Votes by user which keep user ids sorted on insert,
+    so rendering does not have to sort all votes on every click.
+    """
+
+    def __init__(self, default_factory):
+        super().__init__(default_factory)
+        self.sorted_user_ids = []
+
+    def __setitem__(self, user_id, vote):
+        if user_id not in self:
+            bisect.insort(self.sorted_user_ids, user_id)
+        super().__setitem__(user_id, vote)
+
+    def __delitem__(self, user_id):
+        super().__delitem__(user_id)
+        del self.sorted_user_ids[bisect.bisect_left(self.sorted_user_ids, user_id)]
+
+    def clear(self):
+        super().clear()
+        self.sorted_user_ids.clear()
+
+    def sorted_items(self):
+        return ((user_id, self[user_id]) for user_id in self.sorted_user_ids)
@@ -0,0 +1,43 @@
+import asyncio
+import functools
+import logbook
+
+
+class Transition:
+    """
+    Multi-step operation over Telegram and the database which is either completed or compensated.
+    Steps passed to one `run` call are independent and run concurrently.
+    Every succeeded step with a compensation registers it, when any step fails
+    registered compensations run in reverse order and the first error is raised.
+    """
+
+    def __init__(self):
+        self.compensations = []
+
+    async def run(self, *steps) -> list:
+        """
+        Run `(coro, compensation)` steps, where compensation is None or a function
+        which takes the step result and returns a coroutine undoing the step.
+        """
+        results = await asyncio.gather(*[coro for coro, compensation in steps], return_exceptions=True)
+        errors = []
+
+        for (coro, compensation), result in zip(steps, results):
+            if isinstance(result, BaseException):
+                errors.append(result)
+            elif compensation is not None:
+                self.compensations.append(functools.partial(compensation, result))
+
+        if errors:
+            await self.compensate()
+            raise errors[0]
+
+        return results
+
+    async def compensate(self):
+        while self.compensations:
+            compensation = self.compensations.pop()
+            try:
+                await compensation()
+            except Exception:
+                logbook.exception("Error when compensating failed transition")
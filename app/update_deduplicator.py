@@ -0,0 +1,55 @@
+import collections
+
+
+class UpdateDeduplicator:
+    """
+    Skips updates which Telegram delivers again after a restart or a lost `getUpdates` acknowledgement.
+    Update ids up to `last_update_id` are known to be handled, it is persisted and restored on startup.
+    Recently seen update ids and callback query ids are kept in memory up to `capacity` entries.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self.seen_keys = collections.OrderedDict()
+        self.last_update_id = 0
+        self.highest_update_id = 0
+        self.pending_update_ids = set()
+        self.skipped_count = 0
+
+    def is_duplicate(self, update: dict) -> bool:
+        """
+        Check the update and remember it as seen when it is new.
+        """
+        update_id = update["update_id"]
+        keys = [("update", update_id)]
+        if "callback_query" in update:
+            keys.append(("callback_query", update["callback_query"]["id"]))
+
+        if update_id <= self.last_update_id or any(key in self.seen_keys for key in keys):
+            self.skipped_count += 1
+            return True
+
+        for key in keys:
+            self.seen_keys[key] = True
+        while len(self.seen_keys) > self.capacity:
+            self.seen_keys.popitem(last=False)
+
+        self.highest_update_id = max(self.highest_update_id, update_id)
+
+        return False
+
+    def start(self, update_id: int):
+        self.pending_update_ids.add(update_id)
+
+    def finish(self, update_id: int):
+        self.pending_update_ids.discard(update_id)
+
+    def get_processed_update_id(self) -> int:
+        """
+        Highest update id such that every seen update up to it is finished,
+        updates of different chats are handled concurrently and finish out of order.
+        """
+        if self.pending_update_ids:
+            return max(self.last_update_id, min(self.pending_update_ids) - 1)
+
+        return max(self.last_update_id, self.highest_update_id)
@@ -0,0 +1,113 @@
+import asyncio
+import collections
+import logbook
+import time
+
+
+class UpdateDispatcher:
+    """
+    Runs update handlers with a global concurrency limit.
+    Updates of the same chat are handled one by one in arrival order,
+    chats with pending updates take turns in round-robin order.
+    Updates over the limit of a chat queue are dropped and counted, so a flooding chat
+    does not hold back other chats, polling pauses only while all queues together are full.
+    """
+
+    def __init__(self, concurrency_limit: int = 32, chat_queue_limit: int = 100, total_queue_limit: int = 1000):
+        self.concurrency_limit = concurrency_limit
+        self.chat_queue_limit = chat_queue_limit
+        self.total_queue_limit = total_queue_limit
+        self.chat_queues = {}
+        self.ready_chat_ids = collections.deque()
+        self.running_chat_ids = set()
+        self.queued_count = 0
+        self.dropped_count = 0
+        self.handled_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.has_capacity = asyncio.Event()
+        self.has_capacity.set()
+        self.latency_observer = None
+
+    def submit(self, chat_id, coro) -> bool:
+        """
+        Queue the update handler, returns False when the chat queue is full and the handler is dropped.
+        """
+        chat_queue = self.chat_queues.setdefault(chat_id, collections.deque())
+
+        if len(chat_queue) >= self.chat_queue_limit:
+            coro.close()
+            self.dropped_count += 1
+            return False
+
+        chat_queue.append((time.monotonic(), coro))
+        self.queued_count += 1
+
+        if chat_id not in self.running_chat_ids and len(chat_queue) == 1:
+            self.ready_chat_ids.append(chat_id)
+
+        self.update_capacity()
+        self.schedule()
+
+        return True
+
+    async def wait_for_capacity(self):
+        """
+        Backpressure for the polling loop: no new updates are fetched while queues are full.
+        """
+        await self.has_capacity.wait()
+
+    def schedule(self):
+        while self.ready_chat_ids and len(self.running_chat_ids) < self.concurrency_limit:
+            chat_id = self.ready_chat_ids.popleft()
+            enqueued_at, coro = self.chat_queues[chat_id].popleft()
+            self.queued_count -= 1
+            self.running_chat_ids.add(chat_id)
+            asyncio.ensure_future(self.run(chat_id, enqueued_at, coro))
+
+        self.update_capacity()
+
+    async def run(self, chat_id, enqueued_at: float, coro):
+        wait_time = time.monotonic() - enqueued_at
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+
+        try:
+            await coro
+        except Exception:
+            logbook.exception("Error when handling update of chat {}", chat_id)
+        finally:
+            self.handled_count += 1
+            if self.latency_observer is not None:
+                self.latency_observer(time.monotonic() - enqueued_at)
+            self.running_chat_ids.discard(chat_id)
+
+            if self.chat_queues[chat_id]:
+                self.ready_chat_ids.append(chat_id)
+            else:
+                del self.chat_queues[chat_id]
+
+            self.schedule()
+
+    def is_idle(self) -> bool:
+        return self.queued_count == 0 and not self.running_chat_ids
+
+    def update_capacity(self):
+        if self.queued_count < self.total_queue_limit:
+            self.has_capacity.set()
+        else:
+            self.has_capacity.clear()
+
+    def get_stats(self) -> dict:
+        chat_queue_lengths = [len(chat_queue) for chat_queue in self.chat_queues.values()]
+
+        return {
+            "running_count": len(self.running_chat_ids),
+            "queued_count": self.queued_count,
+            "queued_chats_count": len(chat_queue_lengths),
+            "max_chat_queue_length": max(chat_queue_lengths, default=0),
+            "handled_count": self.handled_count,
+            "dropped_count": self.dropped_count,
+            "average_wait_time": self.wait_time_total / self.handled_count if self.handled_count else 0.0,
+            "max_wait_time": self.wait_time_max,
+        }
@@ -0,0 +1,119 @@
+import concurrent.futures
+import copy
+import gzip
+import hashlib
+import hmac
+import json
+import re
+import secrets
+import time
+
+
+class UpdateRecorder:
+    """
+    Appends raw incoming updates to a gzip compressed JSONL file for later replay.
+    User names, texts, captions and command arguments (game names and topics) are anonymised
+    in the message and in messages nested into it, user and chat ids are kept,
+    so the replayed game flow stays the same.
+    Pseudonyms are keyed with a random key which is never written out, so they stay consistent
+    within one recording but can't be reversed by hashing guessed names.
+    Compression and writes run in a single background thread, so they never block the event loop.
+    """
+
+    FLUSH_INTERVAL = 100
+
+    USER_KEYS = ["from", "sender_chat", "forward_from", "forward_from_chat", "new_chat_member", "left_chat_member"]
+    USER_LIST_KEYS = ["new_chat_members"]
+    MESSAGE_KEYS = ["reply_to_message", "pinned_message"]
+    TEXT_KEYS = ["caption"]
+    NAME_FIELDS = ["first_name", "last_name", "username", "title"]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = gzip.open(path, "at", encoding="utf-8")
+        self.records_count = 0
+        self.pseudonym_key = secrets.token_bytes(32)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="update_recorder")
+
+    def record(self, update: dict):
+        line = json.dumps({"time": time.time(), "update": self.anonymise_update(update)}) + "\n"
+        self.executor.submit(self.write, line)
+
+    def write(self, line: str):
+        self.file.write(line)
+        self.records_count += 1
+
+        if self.records_count % self.FLUSH_INTERVAL == 0:
+            self.file.flush()
+
+    def close(self):
+        """
+        Write pending records and the gzip trailer, must be called on shutdown.
+        """
+        self.executor.shutdown(wait=True)
+        self.file.close()
+
+    def anonymise_update(self, update: dict) -> dict:
+        result = copy.deepcopy(update)
+
+        for value in result.values():
+            if isinstance(value, dict):
+                self.anonymise_message(value)
+                if isinstance(value.get("message"), dict):
+                    self.anonymise_message(value["message"])
+
+        return result
+
+    def anonymise_message(self, message: dict):
+        for key in self.USER_KEYS:
+            if isinstance(message.get(key), dict):
+                self.anonymise_names(message[key])
+
+        for key in self.USER_LIST_KEYS:
+            for user in message.get(key) or []:
+                if isinstance(user, dict):
+                    self.anonymise_names(user)
+
+        for key in self.MESSAGE_KEYS:
+            if isinstance(message.get(key), dict):
+                self.anonymise_message(message[key])
+
+        for key in self.TEXT_KEYS:
+            if isinstance(message.get(key), str):
+                message[key] = self.pseudonym(key, message[key])
+
+        if isinstance(message.get("chat"), dict):
+            self.anonymise_names(message["chat"])
+
+        text = message.get("text")
+        if not isinstance(text, str):
+            return
+
+        command_match = re.match(r"(?s)(/\S+)(\s+)(.+)$", text)
+        if command_match:
+            message["text"] = command_match.group(1) + command_match.group(2) + "\n".join(
+                self.pseudonym("topic", line) for line in command_match.group(3).splitlines()
+            )
+        elif not text.startswith("/"):
+            message["text"] = self.pseudonym("text", text)
+
+    def anonymise_names(self, user: dict):
+        for field in self.NAME_FIELDS:
+            if user.get(field):
+                user[field] = self.pseudonym(field, user[field])
+
+    def pseudonym(self, kind: str, value: str) -> str:
+        digest = hmac.new(self.pseudonym_key, value.encode("utf-8"), hashlib.sha256).hexdigest()
+
+        return "{}_{}".format(kind, digest[:8])
+
+    @staticmethod
+    def read(path: str):
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            try:
+                for line in file:
+                    if line.strip():
+                        yield json.loads(line)
+            except (EOFError, json.JSONDecodeError):
+                # Recording of a killed process ends with a truncated record
+                return
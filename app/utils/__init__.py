@@ -1,8 +1,36 @@
+import asyncio
+import logbook
 import sys
 from logbook import StreamHandler
 from logbook.compat import redirect_logging
+from app.utils.log_handlers import QueuedLogHandler, LogSampler, format_json_record
 
 
-def init_logging():
-    StreamHandler(sys.stdout).push_application()
+def init_logging(sample_rate: float = 1.0) -> QueuedLogHandler:
+    stream_handler = StreamHandler(sys.stdout)
+    stream_handler.formatter = format_json_record
+
+    handler = QueuedLogHandler(stream_handler)
+    handler.filter = LogSampler(sample_rate)
+    handler.push_application()
     redirect_logging()
+
+    return handler
+
+
+def install_event_loop_policy(event_loop: str) -> str:
+    """
+    Select `uvloop` event loop when asked for and installed, default asyncio loop otherwise.
+    Must be called before the event loop is created.
+    """
+    if event_loop == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            logbook.warning("uvloop is not installed, using default asyncio event loop")
+            return "asyncio"
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        return "uvloop"
+
+    return "asyncio"
@@ -0,0 +1,68 @@
+from logbook import WARNING, ERROR
+from logbook.queues import ThreadedWrapperHandler, TWHThreadController
+from queue import Full
+import json
+import random
+
+
+class QueuedLogHandler(ThreadedWrapperHandler):
+    """
+    Formats and writes records of the wrapped handler in a background thread.
+    Frame and exception information is pulled before queueing, as records are closed once emitted.
+    When the queue is full regular records are dropped and counted,
+    errors wait for a free slot for a short time and are dropped and counted after that,
+    so logging never blocks the event loop for long.
+    """
+
+    ERROR_PUT_TIMEOUT = 0.1
+
+    _direct_attrs = ThreadedWrapperHandler._direct_attrs | frozenset(["dropped_count"])
+
+    def __init__(self, handler, maxsize: int = 10000):
+        super().__init__(handler, maxsize)
+        self.dropped_count = 0
+
+    def emit(self, record):
+        record.pull_information()
+        item = (TWHThreadController.Command.emit, record)
+        try:
+            if record.level >= ERROR:
+                self.queue.put(item, timeout=self.ERROR_PUT_TIMEOUT)
+            else:
+                self.queue.put_nowait(item)
+        except Full:
+            self.dropped_count += 1
+
+
+class LogSampler:
+    """
+    Handler filter which keeps only a share of records logged with `extra={"sampled": True}`.
+    Warnings and errors are always kept.
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        self.sample_rate = sample_rate
+
+    def __call__(self, record, handler) -> bool:
+        if record.level >= WARNING or not record.extra.get("sampled"):
+            return True
+
+        return random.random() < self.sample_rate
+
+
+def format_json_record(record, handler) -> str:
+    result = {
+        "time": record.time.isoformat(),
+        "level": record.level_name,
+        "channel": record.channel,
+        "message": record.message,
+    }
+
+    for key, value in record.extra.items():
+        if key != "sampled":
+            result[key] = value
+
+    if record.formatted_exception is not None:
+        result["exception"] = record.formatted_exception
+
+    return json.dumps(result, default=str, ensure_ascii=False)
@@ -6,5 +6,5 @@ DB_NAME=devpoker_bot.db
 
 docker build -t ${NAME} .
 docker rm -f ${NAME} || true
-docker run --name ${NAME} -d --restart=unless-stopped -e DEVPOKER_BOT_API_TOKEN=${DEVPOKER_BOT_API_TOKEN} -e DEVPOKER_BOT_DB_PATH=${DB_LOCATION}/${DB_NAME} -v ~/.devpoker_bot/:${DB_LOCATION} ${NAME}
+docker run --name ${NAME} -d --restart=unless-stopped -e DEVPOKER_BOT_API_TOKEN=${DEVPOKER_BOT_API_TOKEN} -e DEVPOKER_BOT_DB_PATH=${DB_LOCATION}/${DB_NAME} -e DEVPOKER_BOT_LOG_SAMPLE_RATE=${DEVPOKER_BOT_LOG_SAMPLE_RATE:-1} -e DEVPOKER_BOT_EVENT_LOOP=${DEVPOKER_BOT_EVENT_LOOP:-asyncio} -e DEVPOKER_BOT_HTTP_POOL_SIZE=${DEVPOKER_BOT_HTTP_POOL_SIZE:-32} -e DEVPOKER_BOT_ADMIN_USER_IDS=${DEVPOKER_BOT_ADMIN_USER_IDS} -v ~/.devpoker_bot/:${DB_LOCATION} ${NAME}
 docker logs -f ${NAME}
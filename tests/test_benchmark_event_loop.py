@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from app.benchmark_event_loop import check_cold_start_budget, find_over_budget, run_benchmark
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ColdStartBudgetTest(unittest.TestCase):
+    RESULTS = [
+        {"event_loop": "asyncio", "cold_start": 0.8},
+        {"event_loop": "uvloop", "cold_start": 1.2},
+    ]
+
+    def test_finds_event_loops_over_budget(self):
+        self.assertEqual(find_over_budget(self.RESULTS, 1.0), [self.RESULTS[1]])
+        self.assertEqual(find_over_budget(self.RESULTS, 1.2), [])
+
+    def test_exits_with_error_when_budget_is_exceeded(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), self.assertRaises(SystemExit) as context:
+            check_cold_start_budget(self.RESULTS, 1.0)
+
+        self.assertEqual(context.exception.code, 1)
+        self.assertIn("uvloop cold start 1.2s exceeds budget 1.0s", output.getvalue())
+
+    def test_passes_within_budget(self):
+        check_cold_start_budget(self.RESULTS, 1.5)
+
+
+class ColdStartTest(unittest.TestCase):
+    """
+    Starts the bot worker through its regular `main` against the fake Bot API.
+    """
+
+    # Generous for slow CI machines, startup takes a fraction of a second locally
+    COLD_START_BUDGET = 10.0
+
+    def setUp(self):
+        environment = mock.patch.dict(os.environ, {"PYTHONPATH": ROOT_PATH})
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def test_measures_cold_start_of_real_worker(self):
+        arguments = argparse.Namespace(chats=1, clicks=1, api_latency=0.0)
+
+        result = asyncio.run(run_benchmark(arguments, "asyncio"))
+
+        self.assertEqual(result["event_loop"], "asyncio")
+        self.assertEqual(result["updates_count"], 3)
+        self.assertGreater(result["cold_start"], 0)
+        self.assertLessEqual(result["cold_start"], self.COLD_START_BUDGET)
+
+    def test_benchmark_fails_over_cold_start_budget(self):
+        command = [sys.executable, "-m", "app.benchmark_event_loop", "--chats", "1", "--clicks", "1"]
+
+        within_budget = subprocess.run(
+            command + ["--cold-start-budget", str(self.COLD_START_BUDGET)],
+            cwd=ROOT_PATH,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        over_budget = subprocess.run(
+            command + ["--cold-start-budget", "0"],
+            cwd=ROOT_PATH,
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+
+        self.assertEqual(within_budget.returncode, 0, within_budget.stderr)
+        self.assertEqual(over_budget.returncode, 1, over_budget.stderr)
+        self.assertIn("exceeds budget 0.0s", over_budget.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
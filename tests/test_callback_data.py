@@ -0,0 +1,110 @@
+import unittest
+
+from app.callback_data import CallbackData
+from app.discussion_vote import DiscussionVote
+from app.game_session import GameSession
+
+
+class CallbackDataTest(unittest.TestCase):
+    OPERATIONS = [
+        GameSession.OPERATION_START_ESTIMATION,
+        GameSession.OPERATION_END_ESTIMATION,
+        GameSession.OPERATION_CLEAR_VOTES,
+        GameSession.OPERATION_RE_ESTIMATE,
+    ]
+
+    def assertDecoded(self, callback_data, action: str, facilitator_message_id: int, vote: str = ""):
+        self.assertIsNotNone(callback_data)
+        self.assertEqual(
+            (callback_data.action, callback_data.facilitator_message_id, callback_data.vote),
+            (action, facilitator_message_id, vote),
+        )
+
+    def test_round_trips_discussion_votes(self):
+        for vote in CallbackData.DISCUSSION_VOTE_CODES:
+            data = CallbackData(CallbackData.ACTION_DISCUSSION_VOTE, 3006, vote).encode()
+
+            self.assertDecoded(CallbackData.decode(data), CallbackData.ACTION_DISCUSSION_VOTE, 3006, vote)
+
+    def test_round_trips_estimation_votes(self):
+        for vote in ["0.5", "1", "36", "XXL", "❓"]:
+            data = CallbackData(CallbackData.ACTION_ESTIMATION_VOTE, 3006, vote).encode()
+
+            self.assertDecoded(CallbackData.decode(data), CallbackData.ACTION_ESTIMATION_VOTE, 3006, vote)
+
+    def test_round_trips_operations(self):
+        for operation in self.OPERATIONS:
+            data = CallbackData(operation, 3006).encode()
+
+            self.assertDecoded(CallbackData.decode(data), operation, 3006)
+
+    def test_round_trips_message_ids(self):
+        # Bulk game sessions keep topic index above the 32-bit message id
+        for facilitator_message_id in [0, 1, 35, 36, 2 ** 31 - 1, (49 << 32) | 123456]:
+            data = CallbackData(CallbackData.ACTION_ESTIMATION_VOTE, facilitator_message_id, "0.5").encode()
+
+            self.assertDecoded(CallbackData.decode(data), CallbackData.ACTION_ESTIMATION_VOTE, facilitator_message_id, "0.5")
+
+    def test_encodes_compact_form(self):
+        data = CallbackData(CallbackData.ACTION_DISCUSSION_VOTE, 3006, DiscussionVote.VOTE_TO_ESTIMATE).encode()
+
+        self.assertEqual(data, "d2bi.e")
+        self.assertEqual(CallbackData(CallbackData.ACTION_ESTIMATION_VOTE, 3006, "0.5").encode(), "e2bi.0.5")
+        self.assertEqual(CallbackData(GameSession.OPERATION_RE_ESTIMATE, 3006).encode(), "r2bi")
+
+    def test_decodes_legacy_discussion_votes(self):
+        callback_data = CallbackData.decode("discussion-vote-click-3006-to_estimate")
+
+        self.assertDecoded(callback_data, CallbackData.ACTION_DISCUSSION_VOTE, 3006, DiscussionVote.VOTE_TO_ESTIMATE)
+
+    def test_decodes_legacy_estimation_votes(self):
+        self.assertDecoded(CallbackData.decode("estimation-vote-click-3006-0.5"), CallbackData.ACTION_ESTIMATION_VOTE, 3006, "0.5")
+        self.assertDecoded(CallbackData.decode("estimation-vote-click-3006-❓"), CallbackData.ACTION_ESTIMATION_VOTE, 3006, "❓")
+
+    def test_decodes_legacy_operations(self):
+        for operation in self.OPERATIONS:
+            self.assertDecoded(CallbackData.decode("{}-click-3006".format(operation)), operation, 3006)
+
+    def test_compact_card_looking_like_legacy_data_is_not_decoded_as_legacy(self):
+        data = CallbackData(CallbackData.ACTION_ESTIMATION_VOTE, 3006, "a-click-1").encode()
+
+        self.assertDecoded(CallbackData.decode(data), CallbackData.ACTION_ESTIMATION_VOTE, 3006, "a-click-1")
+
+    def test_rejects_malformed_data(self):
+        for data in [
+            "",
+            "x2bi",
+            "d",
+            "d.e",
+            "d2bi",
+            "d2bi.x",
+            "d2bi.to_estimate",
+            "e2bi",
+            "e2bi.",
+            "s2bi.e",
+            "s-1",
+            "s+1",
+            "s1_0",
+            "s 1",
+            "s2BI",
+            "sé",
+            "discussion-vote-click-3006",
+            "discussion-vote-click-3006-unknown",
+            "discussion-vote-click-abc-to_estimate",
+            "estimation-vote-click-3006-",
+            "estimation-vote-click--0.5",
+            "start_estimation-click-",
+            "start_estimation-click-2bi",
+            "start_estimation-click--1",
+            "start_estimation-click-１",
+            "unknown-click-3006",
+        ]:
+            with self.subTest(data=data):
+                self.assertIsNone(CallbackData.decode(data))
+
+    def test_decode_legacy_rejects_unknown_prefix(self):
+        self.assertIsNone(CallbackData.decode_legacy("d2bi.e"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+
+from app.card_deck import CardDeck
+
+
+class CardDeckSummaryTest(unittest.TestCase):
+    def test_odd_votes_count(self):
+        summary = CardDeck.get().summarize(["8", "1", "2"])
+
+        self.assertEqual(summary, {
+            "median": 2.0,
+            "median_card": "2",
+            "min_card": "1",
+            "max_card": "8",
+            "spread": 7.0,
+            "votes_count": 3,
+        })
+
+    def test_even_votes_count_averages_middle_votes(self):
+        card_deck = CardDeck.get()
+        summary = card_deck.summarize(["8", "3", "1", "2"])
+
+        self.assertEqual(summary["median"], 2.5)
+        self.assertEqual(summary["median_card"], "2")
+        self.assertEqual(summary["votes_count"], 4)
+        self.assertEqual(card_deck.render_summary_text(["8", "3", "1", "2"]), "Median: 2.5, spread: 1–8")
+
+    def test_repeated_votes(self):
+        summary = CardDeck.get().summarize(["3", "5", "3", "3"])
+
+        self.assertEqual(summary["median"], 3.0)
+        self.assertEqual(summary["spread"], 2.0)
+
+    def test_fractional_card(self):
+        card_deck = CardDeck.get()
+
+        self.assertEqual(card_deck.summarize(["0.5", "1"])["median"], 0.75)
+        self.assertEqual(card_deck.render_summary_text(["0.5", "1"]), "Median: 0.75, spread: 0.5–1")
+
+    def test_unsure_votes_are_not_counted(self):
+        card_deck = CardDeck.get()
+        summary = card_deck.summarize(["5", CardDeck.CARD_UNSURE, "1", CardDeck.CARD_UNSURE])
+
+        self.assertEqual(summary["median"], 3.0)
+        self.assertEqual(summary["votes_count"], 2)
+
+    def test_only_unsure_votes(self):
+        card_deck = CardDeck.get()
+
+        self.assertIsNone(card_deck.summarize([CardDeck.CARD_UNSURE, CardDeck.CARD_UNSURE]))
+        self.assertEqual(card_deck.render_summary_text([CardDeck.CARD_UNSURE]), "")
+
+    def test_no_votes(self):
+        self.assertIsNone(CardDeck.get().summarize([]))
+
+    def test_tshirt_deck_is_ordered_by_card_position(self):
+        card_deck = CardDeck.get(CardDeck.NAME_TSHIRT)
+        summary = card_deck.summarize(["XL", "S", "M"])
+
+        self.assertFalse(card_deck.is_numeric)
+        self.assertEqual((summary["min_card"], summary["median_card"], summary["max_card"]), ("S", "M", "XL"))
+        self.assertEqual(card_deck.render_summary_text(["XL", "S", "M"]), "Median: M, spread: S–XL")
+
+    def test_tshirt_deck_even_votes_count_shows_lower_median_card(self):
+        card_deck = CardDeck.get(CardDeck.NAME_TSHIRT)
+
+        self.assertEqual(card_deck.render_summary_text(["L", "S"]), "Median: S, spread: S–L")
+
+    def test_custom_numeric_deck(self):
+        card_deck = CardDeck.get(CardDeck.NAME_CUSTOM, ["1", "2", "3", "5", "8", "13"])
+
+        self.assertTrue(card_deck.is_numeric)
+        self.assertEqual(card_deck.summarize(["13", "2"])["median"], 7.5)
+        self.assertEqual(card_deck.render_summary_text(["13", "2"]), "Median: 7.5, spread: 2–13")
+
+    def test_custom_deck_of_words(self):
+        card_deck = CardDeck.get(CardDeck.NAME_CUSTOM, ["tiny", "small", "big", "huge"])
+
+        self.assertEqual(card_deck.render_summary_text(["huge", "tiny", "small"]), "Median: small, spread: tiny–huge")
+
+    def test_custom_deck_mixing_numbers_and_words_is_ordered_by_card_position(self):
+        card_deck = CardDeck.get(CardDeck.NAME_CUSTOM, ["10", "1", "big"])
+
+        self.assertFalse(card_deck.is_numeric)
+        self.assertEqual(card_deck.render_summary_text(["1", "10"]), "Median: 10, spread: 10–1")
+
+    def test_stale_votes_are_not_counted(self):
+        summary = CardDeck.get(CardDeck.NAME_FIBONACCI).summarize(["0.5", "13", "XL", "21"])
+
+        self.assertEqual(summary["median"], 17.0)
+        self.assertEqual(summary["votes_count"], 2)
+
+
+class CardDeckVoteTest(unittest.TestCase):
+    def test_accepts_cards_of_the_deck(self):
+        card_deck = CardDeck.get(CardDeck.NAME_FIBONACCI)
+
+        for card in CardDeck.PRESET_CARDS[CardDeck.NAME_FIBONACCI] + [CardDeck.CARD_UNSURE]:
+            self.assertTrue(card_deck.is_valid_vote(card), card)
+
+    def test_rejects_cards_of_other_decks(self):
+        # Votes from keyboards posted before the chat deck was changed
+        self.assertFalse(CardDeck.get(CardDeck.NAME_FIBONACCI).is_valid_vote("0.5"))
+        self.assertFalse(CardDeck.get(CardDeck.NAME_FIBONACCI).is_valid_vote("XL"))
+        self.assertFalse(CardDeck.get(CardDeck.NAME_TSHIRT).is_valid_vote("1"))
+        self.assertFalse(CardDeck.get().is_valid_vote("13"))
+
+    def test_custom_decks_accept_only_their_cards(self):
+        small_deck = CardDeck.get(CardDeck.NAME_CUSTOM, ["1", "2", "3"])
+        large_deck = CardDeck.get(CardDeck.NAME_CUSTOM, ["5", "8"])
+
+        self.assertTrue(small_deck.is_valid_vote("3"))
+        self.assertFalse(small_deck.is_valid_vote("5"))
+        self.assertTrue(large_deck.is_valid_vote("5"))
+        self.assertFalse(large_deck.is_valid_vote("3"))
+
+    def test_rejects_empty_and_too_long_votes_before_lookup(self):
+        self.assertFalse(CardDeck.is_possible_vote(""))
+        self.assertFalse(CardDeck.is_possible_vote("x" * (CardDeck.CARD_LENGTH_LIMIT + 1)))
+        self.assertTrue(CardDeck.is_possible_vote("x" * CardDeck.CARD_LENGTH_LIMIT))
+
+    def test_parses_custom_cards(self):
+        self.assertEqual(CardDeck.parse_custom_cards("1, 2 2 ❓ 3"), ["1", "2", "3"])
+
+        with self.assertRaises(ValueError):
+            CardDeck.parse_custom_cards("❓")
+        with self.assertRaises(ValueError):
+            CardDeck.parse_custom_cards("toolongcard")
+        with self.assertRaises(ValueError):
+            CardDeck.parse_custom_cards(" ".join(str(card) for card in range(CardDeck.CUSTOM_CARDS_LIMIT + 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()